@@ -17,12 +17,23 @@ import seaborn as sns
 import warnings
 from datetime import datetime
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
 from scipy.spatial.distance import cosine
-from sklearn.metrics.pairwise import cosine_similarity
 import joblib
+import multiprocessing
 import os
+from data_pipeline import load_clean_transactions, load_transaction_store, update_transaction_store
+from rfm_analysis import (
+    RFM_FEATURES, compute_rfm, compute_rfm_out_of_core, compute_rfm_parallel, compute_rfm_snapshots,
+    get_reference_date, last_purchase_dates, save_rfm, update_rfm
+)
+from recommendations import build_customer_product_matrix, compute_product_similarity
+from rfm_scoring import build_rfm_sketches, compile_segment_rules, label_segments, rfm_thresholds, score_rfm
+from scoring import SegmentPredictor
+from segmentation import (
+    BOOTSTRAP_PATH, BOOTSTRAP_SAMPLES, K_RANGE, K_SWEEP_PATH, KMEANS_RUNS_PATH, TRAINING_SEEDS,
+    bootstrap_stability, run_k_sweep, run_warm_k_sweep, scalable_silhouette, summarize_bootstrap_ari,
+    summarize_k_sweep, summarize_kmeans_runs, train_kmeans_parallel
+)
 
 warnings.filterwarnings('ignore')
 
@@ -32,27 +43,50 @@ sns.set_palette("husl")
 
 print("✅ Libraries imported successfully!")
 
+# Worker process pools are only used when this file runs as the main script
+# under the 'fork' start method. With 'spawn' (Windows, macOS) every worker
+# would re-run the whole notebook, so the pooled steps run in one process
+POOL_WORKERS = None if __name__ == '__main__' and multiprocessing.get_start_method() == 'fork' else 1
+
 # %%
-# Load the dataset
-df = pd.read_csv('online_retail.csv', encoding='ISO-8859-1')
+# Load the dataset in chunks with explicit dtypes; the Step 2 cleaning rules are
+# applied per chunk so peak memory stays bounded for large exports. The cleaned
+# table is cached in cache/ and reused while the source files are unchanged.
+# DATA_SOURCE may also be a directory or glob of monthly partitions, which are
+# cleaned in parallel when POOL_WORKERS allows (e.g. 'data/monthly/' or
+# 'data/online_retail_*.csv')
+DATA_SOURCE = 'online_retail.csv'
+
+# With INCREMENTAL, only rows newer than the last ingested InvoiceDate/InvoiceNo
+# are cleaned and appended to the store in cache/store/
+INCREMENTAL = False
+
+if INCREMENTAL:
+    new_rows, _ = update_transaction_store(DATA_SOURCE)
+    print(f"📥 Appended {len(new_rows):,} new cleaned rows to the transaction store")
+    df_clean, ingest_report = load_transaction_store()
+else:
+    df_clean, ingest_report = load_clean_transactions(DATA_SOURCE, max_workers=POOL_WORKERS)
+initial_rows = ingest_report['initial_rows']
 print(f"📊 Dataset loaded successfully!")
-print(f"Shape: {df.shape}")
+print(f"Raw rows: {initial_rows:,}")
+print(f"Shape after cleaning: {df_clean.shape}")
 print("\n" + "="*80)
 print("Dataset Info:")
 print("="*80)
-df.info()
+df_clean.info()
 
 # %%
 print("\n" + "="*80)
 print("First 10 rows of the dataset:")
 print("="*80)
-df.head(10)
+df_clean.head(10)
 
 # %%
 print("\n" + "="*80)
 print("Statistical Summary:")
 print("="*80)
-df.describe()
+df_clean.describe()
 
 # %% [markdown]
 # ## 🧹 Step 2: Data Preprocessing and Cleaning
@@ -61,8 +95,8 @@ df.describe()
 print("\n" + "="*80)
 print("Missing Values Analysis:")
 print("="*80)
-missing_values = df.isnull().sum()
-missing_percent = (missing_values / len(df)) * 100
+missing_values = ingest_report['missing_values']
+missing_percent = (missing_values / initial_rows) * 100
 missing_df = pd.DataFrame({
     'Column': missing_values.index,
     'Missing Count': missing_values.values,
@@ -71,34 +105,24 @@ missing_df = pd.DataFrame({
 print(missing_df[missing_df['Missing Count'] > 0])
 
 # %%
-# Data Cleaning Steps
+# Data Cleaning Steps (applied per chunk during ingestion)
 print("\n" + "="*80)
 print("Data Cleaning Process:")
 print("="*80)
 
-initial_rows = len(df)
 print(f"Initial number of rows: {initial_rows:,}")
 
-# 1. Remove rows with missing CustomerID
-df_clean = df[df['CustomerID'].notna()].copy()
-print(f"✅ After removing missing CustomerID: {len(df_clean):,} rows ({len(df_clean)/initial_rows*100:.2f}%)")
-
-# 2. Convert CustomerID to integer
-df_clean['CustomerID'] = df_clean['CustomerID'].astype(int)
-
-# 3. Remove cancelled invoices (starting with 'C')
-df_clean = df_clean[~df_clean['InvoiceNo'].astype(str).str.startswith('C')]
-print(f"✅ After removing cancelled invoices: {len(df_clean):,} rows ({len(df_clean)/initial_rows*100:.2f}%)")
-
-# 4. Remove negative or zero quantities and prices
-df_clean = df_clean[(df_clean['Quantity'] > 0) & (df_clean['UnitPrice'] > 0)]
-print(f"✅ After removing invalid quantities/prices: {len(df_clean):,} rows ({len(df_clean)/initial_rows*100:.2f}%)")
+remaining = ingest_report['remaining']
+print(f"✅ After removing missing CustomerID: {remaining['customer_id']:,} rows ({remaining['customer_id']/initial_rows*100:.2f}%)")
+print(f"✅ After removing cancelled invoices: {remaining['cancelled']:,} rows ({remaining['cancelled']/initial_rows*100:.2f}%)")
+print(f"✅ After removing invalid quantities/prices: {remaining['quantity_price']:,} rows ({remaining['quantity_price']/initial_rows*100:.2f}%)")
 
-# 5. Convert InvoiceDate to datetime
-df_clean['InvoiceDate'] = pd.to_datetime(df_clean['InvoiceDate'])
-
-# 6. Create TotalAmount column
-df_clean['TotalAmount'] = df_clean['Quantity'] * df_clean['UnitPrice']
+quality_report = pd.DataFrame({
+    'Rows Dropped': ingest_report['dropped'],
+    'Rows Remaining': ingest_report['remaining']
+})
+print("\nData Quality Report:")
+print(quality_report)
 
 print(f"\n✅ Final cleaned dataset: {len(df_clean):,} rows")
 print(f"✅ Percentage retained: {len(df_clean)/initial_rows*100:.2f}%")
@@ -118,7 +142,7 @@ print("\n" + "="*80)
 print("Top 10 Countries by Transaction Volume:")
 print("="*80)
 
-country_stats = df_clean.groupby('Country').agg({
+country_stats = df_clean.groupby('Country', observed=True).agg({
     'InvoiceNo': 'nunique',
     'CustomerID': 'nunique',
     'TotalAmount': 'sum'
@@ -136,7 +160,7 @@ plt.xlabel('Number of Transactions')
 plt.ylabel('Country')
 
 plt.subplot(1, 2, 2)
-country_revenue = df_clean.groupby('Country')['TotalAmount'].sum().sort_values(ascending=False).head(10)
+country_revenue = df_clean.groupby('Country', observed=True)['TotalAmount'].sum().sort_values(ascending=False).head(10)
 sns.barplot(x=country_revenue.values, y=country_revenue.index, palette='plasma')
 plt.title('Top 10 Countries by Revenue', fontsize=14, fontweight='bold')
 plt.xlabel('Total Revenue (£)')
@@ -152,7 +176,7 @@ print("\n" + "="*80)
 print("Top 20 Best-Selling Products:")
 print("="*80)
 
-product_stats = df_clean.groupby('Description').agg({
+product_stats = df_clean.groupby('Description', observed=True).agg({
     'Quantity': 'sum',
     'InvoiceNo': 'nunique',
     'TotalAmount': 'sum'
@@ -162,7 +186,7 @@ product_stats.columns = ['Total Quantity', 'Transactions', 'Revenue']
 print(product_stats)
 
 plt.figure(figsize=(12, 8))
-top_products = df_clean.groupby('Description')['Quantity'].sum().sort_values(ascending=False).head(15)
+top_products = df_clean.groupby('Description', observed=True)['Quantity'].sum().sort_values(ascending=False).head(15)
 sns.barplot(y=top_products.index, x=top_products.values, palette='coolwarm')
 plt.title('Top 15 Best-Selling Products', fontsize=14, fontweight='bold')
 plt.xlabel('Total Quantity Sold')
@@ -218,7 +242,7 @@ print("\n" + "="*80)
 print("Customer Monetary Distribution Analysis:")
 print("="*80)
 
-customer_monetary = df_clean.groupby('CustomerID')['TotalAmount'].sum()
+customer_monetary = df_clean.groupby('CustomerID', observed=True)['TotalAmount'].sum()
 print(f"Average customer spending: £{customer_monetary.mean():.2f}")
 print(f"Median customer spending: £{customer_monetary.median():.2f}")
 print(f"Maximum customer spending: £{customer_monetary.max():.2f}")
@@ -251,22 +275,69 @@ print("RFM Analysis - Feature Engineering:")
 print("="*80)
 
 # Get reference date (latest date in dataset + 1 day)
-reference_date = df_clean['InvoiceDate'].max() + pd.Timedelta(days=1)
+reference_date = get_reference_date(df_clean)
 print(f"Reference Date for Recency Calculation: {reference_date}")
 
-# Calculate RFM metrics for each customer
-rfm = df_clean.groupby('CustomerID').agg({
-    'InvoiceDate': lambda x: (reference_date - x.max()).days,  # Recency
-    'InvoiceNo': 'nunique',  # Frequency
-    'TotalAmount': 'sum'  # Monetary
-}).reset_index()
-
-rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
+# Calculate RFM metrics for each customer (vectorized per-customer reductions).
+# With OUT_OF_CORE_RFM, RFM is folded from per-chunk partial aggregates of the
+# raw files instead, for histories that do not fit in memory. With RFM_WORKERS
+# above 1, customers are hash-partitioned and computed in a process pool when
+# POOL_WORKERS allows, and shard by shard in this process otherwise
+OUT_OF_CORE_RFM = False
+RFM_WORKERS = 1
+
+if OUT_OF_CORE_RFM:
+    rfm = compute_rfm_out_of_core(DATA_SOURCE, reference_date)
+elif RFM_WORKERS > 1:
+    rfm = compute_rfm_parallel(df_clean, reference_date, n_shards=RFM_WORKERS,
+                               max_workers=1 if POOL_WORKERS == 1 else RFM_WORKERS)
+else:
+    rfm = compute_rfm(df_clean, reference_date)
 
 print(f"\n✅ RFM metrics calculated for {len(rfm):,} customers")
 print("\nRFM Summary Statistics:")
 print(rfm.describe())
 
+# %%
+# RFM snapshots at every month-end, computed in one cumulative pass. A snapshot
+# covers transactions strictly before its date, so month-ends are taken as the
+# first day of the following month
+first_month = df_clean['InvoiceDate'].min().normalize() + pd.offsets.MonthBegin(1)
+snapshot_dates = pd.date_range(first_month, reference_date, freq='MS')
+rfm_snapshots = compute_rfm_snapshots(df_clean, snapshot_dates)
+
+print("\n" + "="*80)
+print("Monthly RFM Snapshots (customer averages):")
+print("="*80)
+print(rfm_snapshots.groupby('SnapshotDate').agg({
+    'CustomerID': 'count',
+    'Recency': 'mean',
+    'Frequency': 'mean',
+    'Monetary': 'mean'
+}).round(2))
+
+# %%
+# Incremental RFM check: start from the history before the last 30 days and
+# apply the remaining days as nightly update_rfm batches. Invoices are assigned
+# whole to the day they start, so no batch repeats an invoice. The result must
+# equal the RFM table computed above from the full history
+replay_start = reference_date.normalize() - pd.Timedelta(days=30)
+invoice_day = df_clean.groupby('InvoiceNo', observed=True)['InvoiceDate'].transform('min').dt.normalize()
+history = df_clean[invoice_day < replay_start]
+rfm_replayed = compute_rfm(history)
+rfm_replayed['LastPurchase'] = rfm_replayed['CustomerID'].map(last_purchase_dates(history))
+replayed_reference_date = get_reference_date(history)
+for day in pd.date_range(replay_start, reference_date, freq='D'):
+    batch = df_clean[invoice_day == day]
+    rfm_replayed, replayed_reference_date = update_rfm(rfm_replayed, batch, replayed_reference_date)
+
+replayed = rfm_replayed.set_index('CustomerID')[RFM_FEATURES]
+expected = rfm.set_index('CustomerID')[RFM_FEATURES]
+assert replayed.index.equals(expected.index)
+assert (replayed[['Recency', 'Frequency']] == expected[['Recency', 'Frequency']]).all().all()
+assert np.allclose(replayed['Monetary'], expected['Monetary'])
+print(f"✅ 30 nightly update_rfm batches match the full RFM computation for {len(replayed):,} customers")
+
 # %%
 # Visualize RFM Distributions
 fig, axes = plt.subplots(1, 3, figsize=(16, 5))
@@ -306,7 +377,7 @@ print("="*80)
 
 # Standardize RFM values
 scaler = StandardScaler()
-rfm_scaled = scaler.fit_transform(rfm[['Recency', 'Frequency', 'Monetary']])
+rfm_scaled = scaler.fit_transform(rfm[RFM_FEATURES])
 
 print("✅ RFM features normalized using StandardScaler")
 print(f"Shape of scaled data: {rfm_scaled.shape}")
@@ -324,19 +395,28 @@ print("\n" + "="*80)
 print("Finding Optimal Number of Clusters:")
 print("="*80)
 
-# Elbow Method
-inertias = []
-silhouette_scores = []
-K_range = range(2, 11)
+# Elbow Method: with the 'parallel' strategy every K is fitted in its own worker
+# process (one process when POOL_WORKERS is 1); 'warm' seeds each K from the
+# previous solution for fast interactive re-tuning. The per-K metrics are saved
+# to models/k_sweep.csv
+K_SWEEP_STRATEGY = 'parallel'
+K_range = K_RANGE
 
-for k in K_range:
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-    kmeans.fit(rfm_scaled)
-    inertias.append(kmeans.inertia_)
-    silhouette_scores.append(silhouette_score(rfm_scaled, kmeans.labels_))
-    print(f"K={k}: Inertia={kmeans.inertia_:.2f}, Silhouette Score={silhouette_scores[-1]:.4f}")
+if K_SWEEP_STRATEGY == 'warm':
+    k_sweep = run_warm_k_sweep(rfm_scaled, K_range)
+else:
+    k_sweep = run_k_sweep(rfm_scaled, K_range, max_workers=POOL_WORKERS)
+
+for _, run in k_sweep.iterrows():
+    print(f"K={run['K']:.0f}: Inertia={run['Inertia']:.2f}, Silhouette Score={run['Silhouette']:.4f}")
+
+# %%
+# Plot Elbow Curve and Silhouette Scores from the saved sweep metrics
+k_metrics = summarize_k_sweep(pd.read_csv(K_SWEEP_PATH))
+K_range = k_metrics.index
+inertias = k_metrics['Inertia']
+silhouette_scores = k_metrics['Silhouette']
 
-# Plot Elbow Curve and Silhouette Scores
 fig, axes = plt.subplots(1, 2, figsize=(14, 5))
 
 # Elbow curve
@@ -357,7 +437,7 @@ plt.tight_layout()
 plt.savefig('elbow_silhouette.png', dpi=300, bbox_inches='tight')
 plt.show()
 
-optimal_k = silhouette_scores.index(max(silhouette_scores)) + 2
+optimal_k = int(silhouette_scores.idxmax())
 print(f"\n🎯 Optimal number of clusters based on Silhouette Score: {optimal_k}")
 
 # %% [markdown]
@@ -368,12 +448,21 @@ print("\n" + "="*80)
 print(f"Running K-Means Clustering with K={optimal_k}:")
 print("="*80)
 
-# Train final K-Means model
-kmeans_final = KMeans(n_clusters=optimal_k, random_state=42, n_init=10)
-rfm['Cluster'] = kmeans_final.fit_predict(rfm_scaled)
+# Train final K-Means model: every k-means++ init of every seed runs in its own
+# worker process (one process when POOL_WORKERS is 1). The model kept is the
+# lowest-inertia run over all seeds, so it can differ from the single-seed
+# KMeans(random_state=42, n_init=10); with seeds=(42,) it is the same model
+kmeans_final, kmeans_runs = train_kmeans_parallel(rfm_scaled, optimal_k, seeds=TRAINING_SEEDS,
+                                                  max_workers=POOL_WORKERS)
+rfm['Cluster'] = kmeans_final.labels_
 
 print(f"✅ Clustering completed!")
-print(f"✅ Final Silhouette Score: {silhouette_score(rfm_scaled, rfm['Cluster']):.4f}")
+print(f"\nBest run per seed ({len(kmeans_runs)} runs saved to {KMEANS_RUNS_PATH}):")
+print(summarize_kmeans_runs(kmeans_runs).round(4))
+# Exact (blocked) silhouette for small customer bases, stratified sample above
+# SILHOUETTE_EXACT_LIMIT; computed once and reused in the summary
+final_silhouette = scalable_silhouette(rfm_scaled, rfm['Cluster'])
+print(f"✅ Final Silhouette Score: {final_silhouette:.4f}")
 
 # Cluster distribution
 print("\nCluster Distribution:")
@@ -398,26 +487,29 @@ cluster_summary = rfm.groupby('Cluster').agg({
 cluster_summary.columns = ['Avg_Recency', 'Avg_Frequency', 'Avg_Monetary', 'Customer_Count']
 print(cluster_summary)
 
-# Assign labels based on RFM characteristics
-def assign_label(row):
-    if row['Avg_Recency'] < rfm['Recency'].quantile(0.33) and row['Avg_Frequency'] > rfm['Frequency'].quantile(0.67) and row['Avg_Monetary'] > rfm['Monetary'].quantile(0.67):
-        return 'High-Value'
-    elif row['Avg_Frequency'] >= rfm['Frequency'].quantile(0.33) and row['Avg_Monetary'] >= rfm['Monetary'].quantile(0.33):
-        return 'Regular'
-    elif row['Avg_Recency'] > rfm['Recency'].quantile(0.67):
-        return 'At-Risk'
-    else:
-        return 'Occasional'
-
-cluster_summary['Segment'] = cluster_summary.apply(assign_label, axis=1)
+# Quantile sketches of R, F and M are built once; the label thresholds and the
+# classic 1-5 R/F/M scores are read from them instead of rescanning the columns
+rfm_sketches = build_rfm_sketches(rfm)
+label_thresholds = rfm_thresholds(rfm_sketches)
+print("\nRFM Label Thresholds:")
+print(label_thresholds)
+
+rfm = rfm.join(score_rfm(rfm, rfm_sketches))
+
+# Assign labels based on RFM characteristics: the declarative SEGMENT_RULES are
+# compiled against the thresholds once and evaluated for all clusters at once
+segment_rules = compile_segment_rules(label_thresholds)
+cluster_summary['Segment'] = label_segments(cluster_summary, segment_rules, prefix='Avg_')
 print("\n" + "="*80)
 print("Cluster Segments:")
 print("="*80)
 print(cluster_summary)
 
-# Map labels back to RFM dataframe
+# Carry cluster labels over to customers, and label each customer directly
+# from their own RFM values with the same rules
 cluster_label_map = cluster_summary['Segment'].to_dict()
-rfm['Segment'] = rfm['Cluster'].map(cluster_label_map)
+rfm['Segment'] = cluster_summary['Segment'].reindex(rfm['Cluster']).to_numpy()
+rfm['RFM_Segment'] = label_segments(rfm, segment_rules)
 
 # %%
 # Visualize Clusters
@@ -494,6 +586,31 @@ plt.tight_layout()
 plt.savefig('cluster_analysis.png', dpi=300, bbox_inches='tight')
 plt.show()
 
+# %%
+# Cluster stability: refit the segmentation on bootstrap resamples of rfm_scaled
+# (in parallel from shared memory, or in one process when POOL_WORKERS is 1) and
+# compare each refit with the final clusters
+BOOTSTRAP_STABILITY = True
+
+if BOOTSTRAP_STABILITY:
+    print("\n" + "="*80)
+    print(f"Bootstrap Cluster Stability ({BOOTSTRAP_SAMPLES} resamples):")
+    print("="*80)
+
+    customer_stability, bootstrap_runs = bootstrap_stability(rfm_scaled, rfm['Cluster'], max_workers=POOL_WORKERS)
+    print("\nAdjusted Rand Index vs final clusters:")
+    print(summarize_bootstrap_ari(bootstrap_runs).round(4))
+
+    # Per-customer co-assignment: share of bootstraps in which a customer stays
+    # with the rest of their cluster
+    segment_stability = pd.DataFrame({
+        'Stability': pd.Series(customer_stability, index=rfm.index).groupby(rfm['Segment']).mean(),
+        'Unstable_Customers': pd.Series(customer_stability < 0.5, index=rfm.index).groupby(rfm['Segment']).sum(),
+    })
+    print("\nCo-assignment stability by segment:")
+    print(segment_stability.round(4))
+    print(f"✅ Bootstrap runs saved: {BOOTSTRAP_PATH}")
+
 # %% [markdown]
 # ## 🎁 Step 9: Product Recommendation System (Collaborative Filtering)
 
@@ -502,19 +619,19 @@ print("\n" + "="*80)
 print("Building Product Recommendation System:")
 print("="*80)
 
-# Create Customer-Product matrix
-customer_product = df_clean.groupby(['CustomerID', 'Description'])['Quantity'].sum().unstack(fill_value=0)
+# Create Customer-Product matrix: sparse CSR from integer customer/product codes,
+# so memory grows with purchases rather than customers x products
+customer_product, customer_index, product_index = build_customer_product_matrix(df_clean)
 
 print(f"✅ Customer-Product matrix created")
 print(f"Shape: {customer_product.shape}")
 print(f"Customers: {customer_product.shape[0]:,}")
 print(f"Unique Products: {customer_product.shape[1]:,}")
+print(f"Non-zero entries: {customer_product.nnz:,} "
+      f"({customer_product.nnz / np.prod(customer_product.shape):.2%} dense)")
 
-# Calculate item-based cosine similarity
-product_similarity = cosine_similarity(customer_product.T)
-product_similarity_df = pd.DataFrame(product_similarity, 
-                                     index=customer_product.columns,
-                                     columns=customer_product.columns)
+# Calculate item-based cosine similarity from the sparse matrix
+product_similarity_df = compute_product_similarity(customer_product, product_index)
 
 print(f"\n✅ Product similarity matrix computed using Cosine Similarity")
 print(f"Matrix shape: {product_similarity_df.shape}")
@@ -571,8 +688,18 @@ print("✅ Product similarity matrix saved: models/product_similarity.pkl")
 joblib.dump(cluster_label_map, 'models/cluster_labels.pkl')
 print("✅ Cluster labels saved: models/cluster_labels.pkl")
 
-# Save RFM data with clusters
-rfm.to_csv('models/rfm_data.csv', index=False)
+# Save the NumPy segment predictor (scaler + centroids + labels, no scikit-learn needed)
+SegmentPredictor.from_models(scaler, kmeans_final, cluster_label_map).save('models/segment_model.npz')
+print("✅ Segment predictor arrays saved: models/segment_model.npz")
+
+# Save RFM quantile sketches (updatable as new customers stream in)
+joblib.dump(rfm_sketches, 'models/rfm_sketches.pkl')
+print("✅ RFM quantile sketches saved: models/rfm_sketches.pkl")
+
+# Save RFM data with clusters, and each customer's last purchase so the table
+# can be updated in place with update_rfm
+save_rfm(rfm.assign(LastPurchase=rfm['CustomerID'].map(last_purchase_dates(df_clean))),
+         'models/rfm_data.csv', reference_date)
 print("✅ RFM data with clusters saved: models/rfm_data.csv")
 
 print("\n🎉 All models and artifacts saved successfully!")
@@ -594,7 +721,7 @@ print(f"  • Countries: {df_clean['Country'].nunique():,}")
 
 print("\n🎯 Clustering Results:")
 print(f"  • Optimal Clusters: {optimal_k}")
-print(f"  • Silhouette Score: {silhouette_score(rfm_scaled, rfm['Cluster']):.4f}")
+print(f"  • Silhouette Score: {final_silhouette:.4f}")
 
 print("\n🏷️ Customer Segments:")
 for segment, count in rfm['Segment'].value_counts().items():
@@ -6,6 +6,8 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import os
+from rfm_analysis import RFM_FEATURES, load_rfm
+from scoring import BORDERLINE_MEMBERSHIP, load_segment_predictor
 from PIL import Image
 
 # ========================================
@@ -715,21 +717,19 @@ def load_models():
     """Load all saved models and data"""
     try:
         if not os.path.exists('models'):
-            return None, None, None, None, None
+            return None, None, None
         
-        kmeans_model = joblib.load('kmeans_model.pkl')
-        scaler = joblib.load('scaler.pkl')
+        segment_model = load_segment_predictor('.')
         product_similarity = joblib.load('product_similarity.pkl')
-        cluster_labels = joblib.load('cluster_labels.pkl')
-        rfm_data = pd.read_csv('rfm_data.csv')
+        rfm_data = load_rfm('rfm_data.csv')
         
-        return kmeans_model, scaler, product_similarity, cluster_labels, rfm_data
+        return segment_model, product_similarity, rfm_data
     except Exception as e:
         st.error(f"Error loading models: {str(e)}")
-        return None, None, None, None, None
+        return None, None, None
 
 # Load models
-kmeans_model, scaler, product_similarity, cluster_labels, rfm_data = load_models()
+segment_model, product_similarity, rfm_data = load_models()
 
 # ========================================
 # SIDEBAR
@@ -1070,7 +1070,7 @@ elif page == "👥 Customer Segmentation":
     </div>
     """, unsafe_allow_html=True)
     
-    if kmeans_model is None or scaler is None or cluster_labels is None:
+    if segment_model is None:
         st.error("⚠️ Models not loaded. Please run the analysis notebook first to train the models.")
     else:
         st.markdown("""
@@ -1120,11 +1120,11 @@ elif page == "👥 Customer Segmentation":
         if predict_button:
             # Prepare input data
             input_data = np.array([[recency, frequency, monetary]])
-            input_scaled = scaler.transform(input_data)
             
-            # Predict cluster
-            cluster = kmeans_model.predict(input_scaled)[0]
-            segment = cluster_labels[cluster]
+            # Predict cluster with its soft-assignment confidence
+            clusters, _, membership, margin = segment_model.soft_assign(input_data)
+            cluster = clusters[0]
+            segment = segment_model.segments[cluster]
             
             # Display result
             st.markdown(f"""
@@ -1142,6 +1142,14 @@ elif page == "👥 Customer Segmentation":
             </div>
             """, unsafe_allow_html=True)
             
+            # Confidence of the assignment
+            if membership[0] < BORDERLINE_MEMBERSHIP:
+                st.warning(f"⚖️ Borderline customer: {membership[0]:.0%} membership, "
+                           f"{margin[0]:.2f} closer to {segment} than to the next segment")
+            else:
+                st.info(f"📏 Membership {membership[0]:.0%}, "
+                        f"{margin[0]:.2f} closer to {segment} than to the next segment")
+            
             # Segment descriptions
             segment_info = {
                 'High-Value': {
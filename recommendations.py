@@ -0,0 +1,47 @@
+"""
+Item-based product recommendations for Shopper Spectrum.
+
+The customer x product interaction matrix is built as a sparse CSR matrix
+directly from integer customer and product codes, so memory grows with the
+number of distinct (customer, product) purchases instead of customers x
+products. Item-item cosine similarity is computed from that sparse matrix.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+def build_customer_product_matrix(df):
+    """
+    Sparse customer x product matrix of summed quantities.
+
+    Customers and products are factorized to sorted integer codes (the
+    categorical codes when the columns are categorical) and repeated
+    (customer, product) lines are summed while building the CSR matrix.
+    Lines with a missing customer or product (code -1) are dropped, as the
+    pivot table would. Returns the matrix plus the customer and product
+    labels of its rows and columns.
+    """
+    customer_codes, customers = pd.factorize(df['CustomerID'], sort=True)
+    product_codes, products = pd.factorize(df['Description'], sort=True)
+    quantities = df['Quantity'].to_numpy(dtype='float64')
+
+    known = (customer_codes >= 0) & (product_codes >= 0)
+    customer_codes, product_codes, quantities = (
+        customer_codes[known], product_codes[known], quantities[known]
+    )
+    matrix = sparse.csr_matrix(
+        (quantities, (customer_codes, product_codes)), shape=(len(customers), len(products))
+    )
+    matrix.sum_duplicates()
+    customers = pd.Index(np.asarray(customers), name='CustomerID')
+    products = pd.Index(np.asarray(products), name='Description')
+    return matrix, customers, products
+
+
+def compute_product_similarity(matrix, products):
+    """Item-item cosine similarity of a sparse customer x product matrix, as a labelled frame"""
+    similarity = cosine_similarity(matrix.T.tocsr())
+    return pd.DataFrame(similarity, index=products, columns=products)
@@ -0,0 +1,321 @@
+"""
+RFM (Recency, Frequency, Monetary) engine for Shopper Spectrum.
+
+Single implementation of the RFM table shared by the analysis notebook and the
+Streamlit apps. Metrics are computed with built-in vectorized groupby
+reductions only: no per-customer Python callbacks.
+
+Histories larger than RAM are handled out of core: each chunk yields a partial
+aggregate (last purchase, distinct invoices and spend per customer), partials
+merge associatively, and the merged partial is finalized into the RFM table.
+A persisted table that keeps each customer's LastPurchase timestamp can also
+be updated in place from a batch of new transactions, touching only the
+customers that appear in the batch. Large transaction sets can be
+hash-partitioned by CustomerID and computed in a process pool, and RFM as of
+many snapshot dates is built in one cumulative pass.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import CHUNKSIZE, clean_transactions, partition_paths, read_transactions
+
+RFM_FEATURES = ['Recency', 'Frequency', 'Monetary']
+RFM_COLUMNS = ['CustomerID'] + RFM_FEATURES
+
+RFM_DTYPES = {
+    'CustomerID': 'int64',
+    'Recency': 'int64',
+    'Frequency': 'int64',
+    'Monetary': 'float64',
+}
+
+
+def get_reference_date(df):
+    """Reference date for Recency: latest InvoiceDate in the data + 1 day"""
+    return df['InvoiceDate'].max() + pd.Timedelta(days=1)
+
+
+def last_purchase_dates(df):
+    """Latest InvoiceDate per CustomerID, kept with a persisted table for update_rfm"""
+    last_purchase = df.groupby('CustomerID', observed=True)['InvoiceDate'].max()
+    last_purchase.index = last_purchase.index.astype('int64')
+    return last_purchase.rename_axis('CustomerID').rename('LastPurchase')
+
+
+def compute_rfm(df, reference_date=None):
+    """
+    Calculate RFM metrics for each customer from cleaned transactions.
+
+    Recency is days since the customer's last purchase, Frequency the number
+    of distinct invoices and Monetary the summed TotalAmount.
+    """
+    if reference_date is None:
+        reference_date = get_reference_date(df)
+
+    grouped = df.groupby('CustomerID', observed=True)
+    last_purchase = grouped['InvoiceDate'].max()
+
+    rfm = pd.DataFrame({
+        'Recency': (reference_date - last_purchase).dt.days,
+        'Frequency': grouped['InvoiceNo'].nunique(),
+        'Monetary': grouped['TotalAmount'].sum(),
+    })
+    rfm.index = rfm.index.astype('int64')
+    return rfm.rename_axis('CustomerID').reset_index()[RFM_COLUMNS]
+
+
+def shard_transactions(df, n_shards):
+    """Hash-partition transactions by CustomerID so no customer spans two shards"""
+    customer_ids = df['CustomerID']
+    if isinstance(customer_ids.dtype, pd.CategoricalDtype):
+        customer_ids = customer_ids.cat.codes
+    shard_ids = np.asarray(customer_ids, dtype='int64') % n_shards
+    return [shard for _, shard in df.groupby(shard_ids)]
+
+
+def compute_rfm_parallel(df, reference_date=None, n_shards=None, max_workers=None):
+    """
+    Calculate RFM with one customer shard per worker process.
+
+    The reference date is fixed from the full data before sharding, so the
+    concatenated shards equal compute_rfm(df). With max_workers=1 the shards
+    are computed in this process, without a pool. On platforms that spawn
+    workers, call this from a __main__ guard.
+    """
+    if reference_date is None:
+        reference_date = get_reference_date(df)
+    if n_shards is None:
+        n_shards = max_workers or os.cpu_count() or 1
+
+    shards = shard_transactions(df, n_shards)
+    compute = partial(compute_rfm, reference_date=reference_date)
+    if max_workers == 1:
+        results = list(map(compute, shards))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(compute, shards))
+
+    rfm = pd.concat(results, ignore_index=True)
+    return rfm.sort_values('CustomerID', ignore_index=True)
+
+
+def compute_rfm_snapshots(df, snapshot_dates):
+    """
+    Calculate RFM as of every snapshot date in one pass over the transactions.
+
+    A snapshot includes transactions strictly before its date, which plays
+    the role of the reference date. Each line is bucketed to the first
+    snapshot it counts towards; per-bucket sums, invoice counts and last
+    purchase dates are then accumulated across snapshots with cumulative
+    sums/maxima. Returns one row per (SnapshotDate, CustomerID) for customers
+    with at least one purchase before the snapshot, e.g. as of each month-end:
+    compute_rfm_snapshots(df, pd.date_range('2011-01-01', '2012-01-01', freq='MS')).
+    """
+    snapshots = pd.DatetimeIndex(snapshot_dates).sort_values().unique()
+    snapshot_ns = snapshots.to_numpy(dtype='datetime64[ns]')
+    n_snapshots = len(snapshots)
+
+    dates = df['InvoiceDate'].to_numpy(dtype='datetime64[ns]')
+    buckets = np.searchsorted(snapshot_ns, dates, side='right')
+    in_range = buckets < n_snapshots
+
+    customer_codes, customer_ids = pd.factorize(df['CustomerID'], sort=True)
+    invoice_codes, _ = pd.factorize(df['InvoiceNo'])
+    n_customers = len(customer_ids)
+    buckets, customer_codes, invoice_codes = buckets[in_range], customer_codes[in_range], invoice_codes[in_range]
+    cells = buckets * n_customers + customer_codes
+    n_cells = n_snapshots * n_customers
+
+    # Monetary: per-bucket spend, accumulated across snapshots
+    amounts = df['TotalAmount'].to_numpy(dtype='float64')[in_range]
+    monetary = np.bincount(cells, weights=amounts, minlength=n_cells).reshape(n_snapshots, n_customers)
+    monetary = monetary.cumsum(axis=0)
+
+    # Frequency: each invoice counts from the first snapshot it falls before
+    invoice_keys = invoice_codes.astype('int64') * n_customers + customer_codes
+    first_bucket = pd.Series(buckets).groupby(invoice_keys).min()
+    invoice_cells = first_bucket.to_numpy() * n_customers + first_bucket.index.to_numpy() % n_customers
+    frequency = np.bincount(invoice_cells, minlength=n_cells).reshape(n_snapshots, n_customers)
+    frequency = frequency.cumsum(axis=0)
+
+    # Last purchase: per-bucket max date, carried forward with a running max
+    last_ns = np.full(n_cells, np.iinfo('int64').min)
+    bucket_max = pd.Series(dates[in_range].view('int64')).groupby(cells).max()
+    last_ns[bucket_max.index.to_numpy()] = bucket_max.to_numpy()
+    last_ns = np.maximum.accumulate(last_ns.reshape(n_snapshots, n_customers), axis=0)
+
+    snapshot_idx, customer_idx = np.nonzero(frequency > 0)
+    recency_ns = snapshot_ns.view('int64')[snapshot_idx] - last_ns[snapshot_idx, customer_idx]
+    return pd.DataFrame({
+        'SnapshotDate': snapshots[snapshot_idx],
+        'CustomerID': np.asarray(customer_ids, dtype='int64')[customer_idx],
+        'Recency': recency_ns // pd.Timedelta(days=1).value,
+        'Frequency': frequency[snapshot_idx, customer_idx],
+        'Monetary': monetary[snapshot_idx, customer_idx],
+    })
+
+
+def _invoice_keys(invoice_nos):
+    """64-bit integer key per InvoiceNo, hashed once per distinct value when categorical"""
+    if isinstance(invoice_nos.dtype, pd.CategoricalDtype):
+        category_keys = pd.util.hash_array(invoice_nos.cat.categories.to_numpy(dtype=object))
+        return category_keys[invoice_nos.cat.codes.to_numpy()]
+    return pd.util.hash_array(invoice_nos.to_numpy(dtype=object))
+
+
+def partial_rfm(df):
+    """
+    Per-customer partial RFM aggregates for one chunk of cleaned transactions.
+
+    Returns a dict with 'customers' (LastPurchase and Monetary indexed by
+    CustomerID) and 'invoices', a list holding this chunk's distinct
+    (CustomerID, InvoiceKey) integer pairs.
+    """
+    grouped = df.groupby('CustomerID', observed=True)
+    customers = pd.DataFrame({
+        'LastPurchase': grouped['InvoiceDate'].max(),
+        'Monetary': grouped['TotalAmount'].sum(),
+    })
+    customers.index = customers.index.astype('int64')
+
+    invoices = pd.DataFrame({
+        'CustomerID': np.asarray(df['CustomerID'], dtype='int64'),
+        'InvoiceKey': _invoice_keys(df['InvoiceNo']),
+    }).drop_duplicates()
+    return {'customers': customers, 'invoices': [invoices]}
+
+
+def merge_partial_rfm(partials):
+    """
+    Merge partial RFM aggregates; the merge is associative and commutative.
+
+    Customer aggregates are combined right away. Invoice pairs are only
+    collected: each chunk's list is already deduplicated, and pairs shared
+    across chunks are deduplicated once in finalize_rfm.
+    """
+    partials = list(partials)
+    customers = pd.concat([p['customers'] for p in partials])
+    customers = customers.groupby(level=0).agg({'LastPurchase': 'max', 'Monetary': 'sum'})
+    invoices = [chunk for p in partials for chunk in p['invoices']]
+    return {'customers': customers.rename_axis('CustomerID'), 'invoices': invoices}
+
+
+def finalize_rfm(partial, reference_date=None):
+    """Turn a merged partial aggregate into the RFM table"""
+    customers = partial['customers']
+    if reference_date is None:
+        reference_date = customers['LastPurchase'].max() + pd.Timedelta(days=1)
+
+    invoices = pd.concat(partial['invoices'], ignore_index=True).drop_duplicates()
+    rfm = pd.DataFrame({
+        'Recency': (reference_date - customers['LastPurchase']).dt.days,
+        'Frequency': invoices.groupby('CustomerID').size(),
+        'Monetary': customers['Monetary'],
+    })
+    return rfm.rename_axis('CustomerID').reset_index()[RFM_COLUMNS]
+
+
+def compute_rfm_out_of_core(source, reference_date=None, chunksize=CHUNKSIZE):
+    """
+    Calculate RFM from raw transaction files without loading them into memory.
+
+    Chunks are cleaned as in the notebook and folded into a running partial
+    aggregate, so memory grows with customers and invoices, not with lines.
+    """
+    merged = None
+    for path in partition_paths(source):
+        for chunk in read_transactions(path, chunksize=chunksize):
+            chunk, _ = clean_transactions(chunk)
+            partial = partial_rfm(chunk)
+            merged = partial if merged is None else merge_partial_rfm([merged, partial])
+    return finalize_rfm(merged, reference_date)
+
+
+def update_rfm(rfm, new_transactions, reference_date, new_reference_date=None):
+    """
+    Apply a batch of new cleaned transactions to an existing RFM table.
+
+    The table must carry each customer's LastPurchase timestamp (see
+    last_purchase_dates). Recency for every customer is recomputed from it
+    against the new reference date in one vectorized pass, so repeated
+    updates equal a full compute_rfm of the combined history; only
+    customers present in the batch get their LastPurchase, Frequency and
+    Monetary recombined, and new customers are appended. The batch must
+    not repeat invoices already counted in the table (as guaranteed by
+    the incremental transaction store). Extra columns derived from RFM
+    (Cluster, Segment, R/F/M scores, ...) are kept for customers absent
+    from the batch, and left empty for customers in it and for new
+    customers, so stale labels are never carried over; integer columns
+    become nullable Int64. Re-score the empty rows to fill them. Returns
+    the updated table and its new reference date.
+    """
+    if new_reference_date is None:
+        new_reference_date = reference_date
+        if len(new_transactions):
+            new_reference_date = max(reference_date, get_reference_date(new_transactions))
+
+    if 'LastPurchase' not in rfm.columns:
+        raise ValueError(
+            "update_rfm needs the LastPurchase column; recompute the table and save it "
+            "with last_purchase_dates(df) before applying updates"
+        )
+
+    updated = rfm.set_index('CustomerID')
+    delta = compute_rfm(new_transactions, new_reference_date).set_index('CustomerID')
+    delta['LastPurchase'] = last_purchase_dates(new_transactions)
+    known = delta.index.intersection(updated.index)
+    old = updated.loc[known, ['LastPurchase', 'Frequency', 'Monetary']]
+    updated.loc[known, 'LastPurchase'] = np.maximum(old['LastPurchase'], delta.loc[known, 'LastPurchase'])
+    updated.loc[known, 'Frequency'] = old['Frequency'] + delta.loc[known, 'Frequency']
+    updated.loc[known, 'Monetary'] = old['Monetary'] + delta.loc[known, 'Monetary']
+    updated['Recency'] = (new_reference_date - updated['LastPurchase']).dt.days
+
+    derived = updated.columns.difference(RFM_FEATURES + ['LastPurchase'], sort=False)
+    integer_columns = [c for c in derived if pd.api.types.is_integer_dtype(updated[c].dtype)]
+    updated[integer_columns] = updated[integer_columns].astype('Int64')
+    updated.loc[known, derived] = pd.NA
+
+    new_customers = delta.loc[delta.index.difference(updated.index)]
+    updated = pd.concat([updated, new_customers]).sort_index()
+    updated[integer_columns] = updated[integer_columns].astype('Int64')
+    return updated.rename_axis('CustomerID').reset_index(), new_reference_date
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + '_meta.json'
+
+
+def save_rfm(rfm, path, reference_date):
+    """Persist an RFM table together with the reference date it was computed at"""
+    rfm.to_csv(path, index=False)
+    with open(_meta_path(path), 'w') as f:
+        json.dump({'reference_date': pd.Timestamp(reference_date).isoformat()}, f, indent=2)
+
+
+def load_rfm(path='rfm_data.csv'):
+    """Load a persisted RFM table (with optional LastPurchase/Cluster/Segment columns)"""
+    rfm = pd.read_csv(path, dtype={**RFM_DTYPES, 'Cluster': 'Int64'})
+    if 'LastPurchase' in rfm.columns:
+        rfm['LastPurchase'] = pd.to_datetime(rfm['LastPurchase'])
+    return rfm
+
+
+def load_rfm_reference_date(path='rfm_data.csv'):
+    """Reference date a persisted RFM table was computed at"""
+    with open(_meta_path(path)) as f:
+        return pd.Timestamp(json.load(f)['reference_date'])
+
+
+def update_rfm_file(path, new_transactions, new_reference_date=None):
+    """Load a persisted RFM table, apply new transactions and save it back"""
+    rfm, reference_date = update_rfm(
+        load_rfm(path), new_transactions, load_rfm_reference_date(path), new_reference_date
+    )
+    save_rfm(rfm, path, reference_date)
+    return rfm
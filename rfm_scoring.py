@@ -0,0 +1,182 @@
+"""
+RFM scoring for Shopper Spectrum.
+
+Builds one mergeable quantile sketch per RFM feature, then assigns classic
+1-5 R/F/M scores and the 33rd/67th percentile thresholds used for segment
+labels in a single vectorized pass. Sketches can be updated with new batches
+of customers or merged across shards without revisiting old data.
+
+Segment labels come from declarative rules over those thresholds, compiled
+into np.select conditions so cluster summaries and individual customers are
+labelled in one vectorized call.
+"""
+
+import numpy as np
+import pandas as pd
+
+from rfm_analysis import RFM_FEATURES
+
+# Quintile edges for 1-5 scores and the percentiles used by segment labels
+SCORE_QUANTILES = [0.2, 0.4, 0.6, 0.8]
+LABEL_QUANTILES = [0.33, 0.67]
+
+# Segment rules, checked in order: (segment, [(feature, operator, quantile), ...]).
+# A row gets the first segment whose clauses all hold, else DEFAULT_SEGMENT.
+SEGMENT_RULES = [
+    ('High-Value', [('Recency', '<', 0.33), ('Frequency', '>', 0.67), ('Monetary', '>', 0.67)]),
+    ('Regular', [('Frequency', '>=', 0.33), ('Monetary', '>=', 0.33)]),
+    ('At-Risk', [('Recency', '>', 0.67)]),
+]
+DEFAULT_SEGMENT = 'Occasional'
+
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with bounded relative error.
+
+    Positive values are counted in logarithmic bins so every estimate is
+    within `relative_accuracy` of a true sample value; zero and negative
+    values share a single bin that reports 0. Memory grows with the
+    log-range of the data, not with the number of values. Estimates are
+    clamped to the observed minimum and maximum, and rounded when every value
+    seen so far is integral (e.g. Recency and Frequency).
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.keys = np.empty(0, dtype='int64')
+        self.counts = np.empty(0, dtype='int64')
+        self.zero_count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.integral = True
+
+    @property
+    def count(self):
+        return int(self.counts.sum()) + self.zero_count
+
+    def _add_bins(self, keys, counts):
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.keys)).astype('int64')
+
+    def update(self, values):
+        """Add a batch of values"""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.integral = self.integral and bool(np.all(values == np.round(values)))
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+
+        keys, counts = np.unique(np.ceil(np.log(positive) / np.log(self.gamma)).astype('int64'), return_counts=True)
+        self._add_bins(keys, counts)
+        return self
+
+    def merge(self, other):
+        """Fold another sketch with the same accuracy into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.integral = self.integral and other.integral
+        self._add_bins(other.keys, other.counts)
+        return self
+
+    def quantile(self, q):
+        """Estimate one or more quantiles (q in [0, 1])"""
+        if self.count == 0:
+            raise ValueError("Cannot compute quantiles of an empty sketch")
+
+        q = np.asarray(q, dtype='float64')
+        ranks = q * (self.count - 1)
+
+        # Bin 0 holds zero/negative values, then the logarithmic bins in order
+        bin_values = np.concatenate([[0.0], 2 * self.gamma ** self.keys / (self.gamma + 1)])
+        cumulative = np.cumsum(np.concatenate([[self.zero_count], self.counts]))
+        idx = np.searchsorted(cumulative, ranks, side='right')
+        estimates = np.clip(bin_values[np.minimum(idx, len(bin_values) - 1)], self.min, self.max)
+        if self.integral:
+            estimates = np.round(estimates)
+        return estimates if estimates.ndim else float(estimates)
+
+
+def build_rfm_sketches(rfm, sketches=None, relative_accuracy=0.01):
+    """Create or update one quantile sketch per RFM feature from an RFM table"""
+    if sketches is None:
+        sketches = {feature: QuantileSketch(relative_accuracy) for feature in RFM_FEATURES}
+    for feature in RFM_FEATURES:
+        sketches[feature].update(rfm[feature].to_numpy())
+    return sketches
+
+
+def rfm_thresholds(sketches, quantiles=LABEL_QUANTILES):
+    """Quantile thresholds per RFM feature (rows: quantiles, columns: features)"""
+    return pd.DataFrame(
+        {feature: sketches[feature].quantile(quantiles) for feature in RFM_FEATURES},
+        index=pd.Index(quantiles, name='Quantile'),
+    )
+
+
+def score_rfm(rfm, sketches):
+    """
+    Assign 1-5 R/F/M scores against the sketches' quintile edges.
+
+    A value scores one more than the number of edges strictly below it, so
+    ties at an edge take the lower score; Recency is reversed so the most
+    recent customers score 5. Returns the three scores plus their
+    concatenation as the classic RFM_Score string.
+    """
+    edges = rfm_thresholds(sketches, SCORE_QUANTILES)
+    scores = pd.DataFrame(index=rfm.index)
+    for feature in RFM_FEATURES:
+        score = np.searchsorted(edges[feature].to_numpy(), rfm[feature].to_numpy(), side='left') + 1
+        scores[f"{feature[0]}_Score"] = 6 - score if feature == 'Recency' else score
+
+    scores['RFM_Score'] = (
+        scores['R_Score'].astype(str) + scores['F_Score'].astype(str) + scores['M_Score'].astype(str)
+    )
+    return scores
+
+
+def compile_segment_rules(thresholds, rules=SEGMENT_RULES):
+    """
+    Resolve rule quantiles to threshold values.
+
+    Returns (segment, [(feature, operator function, threshold), ...]) pairs
+    ready for label_segments.
+    """
+    return [
+        (segment, [(feature, OPERATORS[op], thresholds.loc[q, feature]) for feature, op, q in clauses])
+        for segment, clauses in rules
+    ]
+
+
+def label_segments(frame, compiled_rules, default=DEFAULT_SEGMENT, prefix=''):
+    """
+    Label every row of `frame` with the first matching segment rule.
+
+    Feature columns are read as prefix + feature, so cluster summaries
+    ('Avg_Recency', ...) and customer tables ('Recency', ...) share rules.
+    """
+    conditions = []
+    for _, clauses in compiled_rules:
+        condition = np.ones(len(frame), dtype=bool)
+        for feature, op, threshold in clauses:
+            condition &= op(frame[prefix + feature].to_numpy(), threshold)
+        conditions.append(condition)
+
+    segments = [segment for segment, _ in compiled_rules]
+    return pd.Series(np.select(conditions, segments, default), index=frame.index, name='Segment')
@@ -0,0 +1,402 @@
+"""
+Customer segment scoring for Shopper Spectrum.
+
+SegmentPredictor is a pure-NumPy copy of the trained StandardScaler and
+K-Means centroids, saved as a tiny segment_model.npz array file. Scoring
+workers and the Streamlit apps load it without importing scikit-learn and get
+the same labels as scaler.transform + kmeans_model.predict.
+
+Bulk scoring streams an RFM file in chunks through the predictor with
+vectorized predictions and writes each customer's cluster and segment label.
+Used for nightly CRM exports:
+
+    python scoring.py --input customers_rfm.csv --output customers_segments.csv
+
+For high-QPS scoring, SegmentGrid precomputes the segment of every cell of a
+bounded Recency x Frequency x Monetary grid, so a prediction is one array
+lookup; rows in cells that straddle a cluster boundary (or outside the grid)
+fall back to the exact predictor. `--grid` scores with it and
+`--benchmark-grid N` times it against the scaler + K-Means predict path.
+
+`--confidence` adds soft-assignment columns (distance to every centroid,
+softmax membership and margin to the runner-up) to flag borderline customers.
+"""
+
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from rfm_analysis import RFM_DTYPES, RFM_FEATURES
+
+MODELS_DIR = 'models'
+SEGMENT_MODEL_FILE = 'segment_model.npz'
+SCORING_CHUNKSIZE = 500_000
+
+# Soft assignment: softmax temperature over distances relative to the nearest
+# centroid (scale-free), and the membership below which a customer is flagged
+# as borderline. With two segments, 0.75 means the runner-up centroid is less
+# than about 27% farther away than the nearest one.
+SOFT_TEMPERATURE = 0.25
+BORDERLINE_MEMBERSHIP = 0.75
+
+# Decision grid per feature: (low, high, cell width). Bounds match the app's inputs.
+SEGMENT_GRID = {
+    'Recency': (0, 1000, 5),
+    'Frequency': (0, 1000, 5),
+    'Monetary': (0.0, 100_000.0, 500.0),
+}
+
+
+class SegmentPredictor:
+    """StandardScaler + nearest-centroid segment prediction in pure NumPy"""
+
+    def __init__(self, mean, scale, centers, segments):
+        self.mean = np.asarray(mean, dtype='float64')
+        self.scale = np.asarray(scale, dtype='float64')
+        self.centers = np.asarray(centers, dtype='float64')
+        self.segments = np.asarray(segments, dtype=str)
+
+    @classmethod
+    def from_models(cls, scaler, kmeans_model, cluster_labels):
+        """
+        Export the arrays of a fitted scaler, K-Means model and label mapping.
+
+        Raises ValueError when the labels are not exactly one per cluster of
+        this model, e.g. labels left over from a model with another K.
+        """
+        n_clusters = len(kmeans_model.cluster_centers_)
+        if sorted(cluster_labels) != list(range(n_clusters)):
+            raise ValueError(
+                f"{len(cluster_labels)} cluster labels do not match the model's {n_clusters} clusters"
+            )
+        segments = [cluster_labels[c] for c in range(n_clusters)]
+        return cls(scaler.mean_, scaler.scale_, kmeans_model.cluster_centers_, segments)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['mean'], arrays['scale'], arrays['centers'], arrays['segments'])
+
+    def save(self, path):
+        """Write the arrays to an .npz file, atomically"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, mean=self.mean, scale=self.scale, centers=self.centers, segments=self.segments)
+        os.replace(tmp_path, path)
+
+    def transform(self, X):
+        """Scale raw RFM values like the fitted StandardScaler"""
+        return (np.asarray(X, dtype='float64') - self.mean) / self.scale
+
+    def squared_distances(self, X):
+        """Squared distance of each row of raw RFM values to every centroid, in scaled space"""
+        diff = self.transform(X)[:, None, :] - self.centers[None, :, :]
+        return np.einsum('ijk,ijk->ij', diff, diff)
+
+    def predict(self, X):
+        """Cluster of each row of raw RFM values (nearest centroid in scaled space)"""
+        return self.squared_distances(X).argmin(axis=1)
+
+    def soft_assign(self, X, temperature=SOFT_TEMPERATURE):
+        """
+        Soft segment assignment for each row of raw RFM values.
+
+        Returns (clusters, distances, membership, margin): the nearest
+        cluster, the distance to every centroid, the membership of the
+        nearest cluster and the distance gap to the second-closest centroid.
+        Membership is a softmax of -(d / d_nearest - 1) / temperature over
+        all centroids, so it depends on how much farther the other centroids
+        are relative to the nearest one, not on the absolute distances: a
+        customer far from every centroid but almost equidistant between two
+        of them gets a membership near 1 / 2.
+        """
+        squared = self.squared_distances(X)
+        clusters = squared.argmin(axis=1)
+        rows = np.arange(len(squared))
+
+        distances = np.sqrt(squared)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = distances / distances[rows, clusters][:, None]
+        ratios[rows, clusters] = 1.0
+        membership = 1 / np.exp(-(ratios - 1) / temperature).sum(axis=1)
+
+        if distances.shape[1] > 1:
+            two_closest = np.partition(distances, 1, axis=1)[:, :2]
+            margin = two_closest[:, 1] - two_closest[:, 0]
+        else:
+            margin = np.full(len(distances), np.inf)
+        return clusters, distances, membership, margin
+
+    def predict_segments(self, X):
+        """Segment label of each row of raw RFM values"""
+        return self.segments[self.predict(X)]
+
+
+def load_segment_predictor(models_dir=MODELS_DIR):
+    """
+    Load the NumPy segment predictor from a models directory.
+
+    Uses segment_model.npz when present; otherwise builds it from the
+    scaler/K-Means pickles, which imports scikit-learn.
+    """
+    array_path = os.path.join(models_dir, SEGMENT_MODEL_FILE)
+    if os.path.exists(array_path):
+        return SegmentPredictor.load(array_path)
+
+    return SegmentPredictor.from_models(
+        joblib.load(os.path.join(models_dir, 'scaler.pkl')),
+        joblib.load(os.path.join(models_dir, 'kmeans_model.pkl')),
+        joblib.load(os.path.join(models_dir, 'cluster_labels.pkl')),
+    )
+
+
+class SegmentGrid:
+    """
+    Precomputed segment lookup over a bounded RFM grid.
+
+    Each cell stores the cluster of all 8 of its corners when they agree,
+    else -1. Clusters are convex regions (intersections of half-spaces
+    between centroids), so a cell whose corners agree lies entirely inside
+    one cluster and the lookup is exact for any value in it, integer or not.
+    Rows in -1 cells or outside the grid use the exact predictor.
+    """
+
+    def __init__(self, predictor, lows, steps, cells):
+        self.predictor = predictor
+        self.lows = np.asarray(lows, dtype='float64')
+        self.steps = np.asarray(steps, dtype='float64')
+        self.cells = np.asarray(cells, dtype='int8')
+        self._bounds = (self.lows.tolist(), self.steps.tolist(), self.cells.shape)
+
+    @classmethod
+    def build(cls, predictor, spec=SEGMENT_GRID):
+        """Predict every grid corner (one Recency slab at a time) and keep the cells whose corners agree"""
+        lows, highs, steps = (np.array([spec[f][i] for f in RFM_FEATURES], dtype='float64') for i in range(3))
+        shape = np.ceil((highs - lows) / steps).astype('int64')
+        recency, frequency, monetary = (lows[i] + steps[i] * np.arange(shape[i] + 1) for i in range(3))
+
+        plane = np.stack(np.meshgrid(frequency, monetary, indexing='ij'), axis=-1).reshape(-1, 2)
+        corners = np.empty(shape + 1, dtype='int8')
+        for i, r in enumerate(recency):
+            X = np.column_stack([np.full(len(plane), r), plane])
+            corners[i] = predictor.predict(X).reshape(shape[1] + 1, shape[2] + 1)
+
+        cells = corners[:-1, :-1, :-1].copy()
+        for di, dj, dk in np.ndindex(2, 2, 2):
+            if di or dj or dk:
+                corner = corners[di:di + shape[0], dj:dj + shape[1], dk:dk + shape[2]]
+                cells[corner != cells] = -1
+        return cls(predictor, lows, steps, cells)
+
+    @property
+    def segments(self):
+        return self.predictor.segments
+
+    @property
+    def exact_fraction(self):
+        """Share of grid cells answered by lookup alone"""
+        return float((self.cells >= 0).mean())
+
+    def predict(self, X):
+        """Cluster of each row of raw RFM values: grid lookup, exact fallback where needed"""
+        X = np.asarray(X, dtype='float64')
+        shape = np.array(self.cells.shape)
+        position = (X - self.lows) / self.steps
+        in_grid = ((position >= 0) & (position < shape)).all(axis=1)
+        with np.errstate(invalid='ignore'):
+            idx = position.astype('int64')
+        flat = idx @ np.array([shape[1] * shape[2], shape[2], 1])
+
+        clusters = self.cells.ravel().take(np.where(in_grid, flat, 0)).astype('int64')
+        fallback = (clusters < 0) | ~in_grid
+        if fallback.any():
+            clusters[fallback] = self.predictor.predict(X[fallback])
+        return clusters
+
+    def predict_one(self, recency, frequency, monetary):
+        """Cluster of a single customer without array overhead, for per-request scoring"""
+        (r0, f0, m0), (rs, fs, ms), (n_r, n_f, n_m) = self._bounds
+        i, j, k = (recency - r0) / rs, (frequency - f0) / fs, (monetary - m0) / ms
+        if 0 <= i < n_r and 0 <= j < n_f and 0 <= k < n_m:
+            cluster = self.cells.item(int(i), int(j), int(k))
+            if cluster >= 0:
+                return cluster
+        return int(self.predictor.predict([[recency, frequency, monetary]])[0])
+
+    def predict_segments(self, X):
+        """Segment label of each row of raw RFM values"""
+        return self.predictor.segments[self.predict(X)]
+
+
+def score_segments(rfm, predictor):
+    """
+    Predict clusters and segment labels for a frame of RFM values.
+
+    Returns a frame with 'Cluster' and 'Segment' aligned to rfm's index.
+    """
+    clusters = predictor.predict(rfm[RFM_FEATURES].to_numpy(dtype='float64'))
+    return pd.DataFrame({'Cluster': clusters, 'Segment': predictor.segments[clusters]}, index=rfm.index)
+
+
+def score_segment_confidence(rfm, predictor, temperature=SOFT_TEMPERATURE,
+                             borderline=BORDERLINE_MEMBERSHIP):
+    """
+    Hard segments plus soft-assignment confidence for a frame of RFM values.
+
+    Adds Distance_<cluster> columns (scaled space), Membership, Margin and a
+    Borderline flag for customers whose membership is below `borderline`.
+    """
+    X = rfm[RFM_FEATURES].to_numpy(dtype='float64')
+    clusters, distances, membership, margin = predictor.soft_assign(X, temperature)
+    scores = pd.DataFrame({'Cluster': clusters, 'Segment': predictor.segments[clusters]}, index=rfm.index)
+    for cluster in range(distances.shape[1]):
+        scores[f"Distance_{cluster}"] = distances[:, cluster]
+    scores['Membership'] = membership
+    scores['Margin'] = margin
+    scores['Borderline'] = membership < borderline
+    return scores
+
+
+def score_rfm_file(input_path, output_path, predictor, chunksize=SCORING_CHUNKSIZE, confidence=False):
+    """
+    Score an RFM CSV chunk by chunk and append the results to a CSV.
+
+    The output keeps the input columns and adds Cluster and Segment, plus
+    the soft-assignment columns of score_segment_confidence when
+    `confidence` is set. Returns the number of customers scored.
+    """
+    scored = 0
+    for i, chunk in enumerate(pd.read_csv(input_path, dtype=RFM_DTYPES, chunksize=chunksize)):
+        chunk = chunk.drop(columns=['Cluster', 'Segment'], errors='ignore')
+        if confidence:
+            chunk = chunk.join(score_segment_confidence(chunk, predictor))
+        else:
+            chunk = chunk.join(score_segments(chunk, predictor))
+        chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        scored += len(chunk)
+    return scored
+
+
+def _time_per_row(predict, X, repeat=3):
+    """Best-of-repeat seconds per row for predict(X)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(X)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(X)
+
+
+def _time_per_request(predict, X, repeat=3):
+    """Best-of-repeat seconds per single-row predict call"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(len(X)):
+            predict(X[i:i + 1])
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(X)
+
+
+def benchmark_segment_grid(models_dir=MODELS_DIR, n_rows=1_000_000, n_requests=2_000, random_state=42):
+    """
+    Time segment prediction on random RFM inputs within the grid bounds.
+
+    Compares scaler.transform + kmeans_model.predict (the pickles), the NumPy
+    SegmentPredictor and the SegmentGrid, for one large batch and for
+    single-row requests. Returns one row per method with rows/s, microseconds
+    per request and agreement with the scikit-learn labels; the SegmentGrid
+    rows also carry the grid build time and the fraction of cells answered by
+    lookup alone.
+    """
+    scaler = joblib.load(os.path.join(models_dir, 'scaler.pkl'))
+    kmeans_model = joblib.load(os.path.join(models_dir, 'kmeans_model.pkl'))
+    predictor = load_segment_predictor(models_dir)
+    start = time.perf_counter()
+    grid = SegmentGrid.build(predictor)
+    build_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(random_state)
+    lows, highs, _ = zip(*(SEGMENT_GRID[f] for f in RFM_FEATURES))
+    X = np.column_stack([
+        rng.integers(lows[0], highs[0], n_rows),
+        rng.integers(lows[1], highs[1], n_rows),
+        rng.uniform(lows[2], highs[2], n_rows),
+    ]).astype('float64')
+    X_frame = pd.DataFrame(X, columns=RFM_FEATURES)
+
+    def grid_predict_one(X):
+        return grid.predict_one(*X[0])
+
+    def sklearn_predict(X):
+        return kmeans_model.predict(scaler.transform(pd.DataFrame(X, columns=RFM_FEATURES)))
+
+    reference = sklearn_predict(X_frame)
+    methods = {
+        'scaler + KMeans.predict': sklearn_predict,
+        'SegmentPredictor': predictor.predict,
+        'SegmentGrid': grid.predict,
+    }
+    rows = []
+    for name, predict in methods.items():
+        rows.append({
+            'Method': name,
+            'Rows_per_sec': 1 / _time_per_row(predict, X),
+            'Request_us': _time_per_request(predict, X[:n_requests]) * 1e6,
+            'Agreement': float((predict(X) == reference).mean()),
+        })
+    one_by_one = np.array([grid_predict_one(X[i:i + 1]) for i in range(n_requests)])
+    rows.append({
+        'Method': 'SegmentGrid.predict_one',
+        'Rows_per_sec': np.nan,
+        'Request_us': _time_per_request(grid_predict_one, X[:n_requests]) * 1e6,
+        'Agreement': float((one_by_one == reference[:n_requests]).mean()),
+    })
+    report = pd.DataFrame(rows).set_index('Method')
+    is_grid = report.index.str.startswith('SegmentGrid')
+    report['Build_Seconds'] = np.where(is_grid, build_seconds, np.nan)
+    report['Exact_Fraction'] = np.where(is_grid, grid.exact_fraction, np.nan)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score customer segments in bulk from an RFM file")
+    parser.add_argument('--input', help="RFM table (CSV with Recency, Frequency, Monetary)")
+    parser.add_argument('--output', help="output CSV with Cluster and Segment columns")
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    parser.add_argument('--chunksize', type=int, default=SCORING_CHUNKSIZE)
+    parser.add_argument('--grid', action='store_true', help="score with the precomputed segment grid")
+    parser.add_argument('--confidence', action='store_true',
+                        help="add centroid distances, Membership, Margin and Borderline columns")
+    parser.add_argument('--benchmark-grid', type=int, metavar='N',
+                        help="benchmark the segment grid on N random rows instead of scoring a file")
+    args = parser.parse_args(argv)
+
+    if args.benchmark_grid:
+        report = benchmark_segment_grid(args.models_dir, n_rows=args.benchmark_grid)
+        grid = report.loc['SegmentGrid']
+        print(f"Grid built in {grid['Build_Seconds']:.2f}s; "
+              f"{grid['Exact_Fraction']:.2%} of cells answered by lookup alone")
+        print(report.round(3).to_string())
+        return
+    if not args.input or not args.output:
+        parser.error("--input and --output are required")
+    if args.grid and args.confidence:
+        parser.error("--confidence needs distances to every centroid; drop --grid")
+
+    predictor = load_segment_predictor(args.models_dir)
+    if args.grid:
+        predictor = SegmentGrid.build(predictor)
+
+    start = time.perf_counter()
+    scored = score_rfm_file(args.input, args.output, predictor, args.chunksize, args.confidence)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Scored {scored:,} customers in {elapsed:.1f}s ({scored / max(elapsed, 1e-9) * 60:,.0f} rows/min)")
+    print(f"✅ Segments written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,777 @@
+"""
+Customer segmentation training for Shopper Spectrum.
+
+Model selection for the K-Means segmentation: every (K, seed) fit of the
+elbow/silhouette search runs in its own worker process, and the per-run
+metrics are saved as an artifact the plotting stage reads back. A warm-started
+sweep instead seeds K+1 from the K solution by splitting its highest-inertia
+cluster, so each K needs a single short K-Means run.
+
+The final model is trained with every k-means++ init (for one or more seeds)
+fitted in its own worker process; the best run is picked exactly as
+scikit-learn's n_init loop picks it, and every run's inertia and agreement with
+the chosen model are saved as a stability record. Bootstrap stability refits
+the segmentation on many resamples in parallel workers that read the scaled
+matrix from shared memory, and reports per-customer co-assignment stability
+and the distribution of adjusted Rand indices.
+
+Silhouette scores are computed in row blocks so memory stays bounded. Above
+SILHOUETTE_EXACT_LIMIT customers, the score is estimated from a stratified
+sample of customers instead, with a confidence interval for the estimate.
+
+For very large customer bases, a MiniBatch training mode streams the RFM table
+from disk (once to fit the scaler, then once per K-Means epoch) so the scaled
+matrix is never held in memory. Retrained clusters are relabelled with the
+segment rules of notebook Step 8, and scaler.pkl, kmeans_model.pkl,
+cluster_labels.pkl and segment_model.npz are replaced together in the
+directory the apps load them from (--output-dir to write elsewhere):
+
+    python segmentation.py minibatch --rfm models/rfm_data.csv --clusters 4
+    python segmentation.py train --rfm models/rfm_data.csv --clusters 4
+    python segmentation.py benchmark-sweep --rfm models/rfm_data.csv
+
+Between full retrains, OnlineSegmenter keeps the centroids fresh from a stream
+of updated customer RFM vectors and checkpoints them to the kmeans_model.pkl
+and segment_model.npz the apps load:
+
+    python segmentation.py online --rfm rfm_updates.csv
+"""
+
+import argparse
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from sklearn.cluster import KMeans, MiniBatchKMeans, kmeans_plusplus
+from sklearn.metrics import adjusted_rand_score
+from sklearn.metrics.pairwise import euclidean_distances
+from sklearn.preprocessing import StandardScaler
+from sklearn.utils.extmath import row_norms
+from threadpoolctl import threadpool_limits
+
+from rfm_analysis import RFM_DTYPES, RFM_FEATURES
+from rfm_scoring import build_rfm_sketches, compile_segment_rules, label_segments, rfm_thresholds
+from scoring import SEGMENT_MODEL_FILE, SegmentPredictor
+
+K_RANGE = range(2, 11)
+RANDOM_STATE = 42
+N_INIT = 10
+
+MODELS_DIR = 'models'
+# Where the apps' load_models() reads the deployed model
+APP_MODELS_DIR = '.'
+K_SWEEP_PATH = os.path.join(MODELS_DIR, 'k_sweep.csv')
+KMEANS_RUNS_PATH = os.path.join(MODELS_DIR, 'kmeans_runs.csv')
+
+# Seeds of the final model: the best run over all of them is kept (with the
+# first seed alone the result equals KMeans(random_state=42)), and agreement
+# across seeds measures cluster stability
+TRAINING_SEEDS = (RANDOM_STATE, 43, 44, 45, 46)
+
+# Bootstrap stability: resamples, K-Means inits per resample, and the size
+# above which resamples are fitted with MiniBatch K-Means instead
+BOOTSTRAP_SAMPLES = 100
+BOOTSTRAP_N_INIT = 3
+BOOTSTRAP_MINIBATCH_LIMIT = 200_000
+BOOTSTRAP_PATH = os.path.join(MODELS_DIR, 'bootstrap_stability.csv')
+
+# Streaming (MiniBatch) training
+MINIBATCH_SIZE = 4096
+MINIBATCH_EPOCHS = 5
+MINIBATCH_INIT_SAMPLE = 20_000
+
+# Silhouette evaluation
+SILHOUETTE_EXACT_LIMIT = 20_000
+SILHOUETTE_SAMPLE_SIZE = 10_000
+SILHOUETTE_BLOCK_SIZE = 1_000
+
+# Online centroid updates
+ONLINE_DECAY = 0.999
+ONLINE_CHECKPOINT_EVERY = 100_000
+
+
+def silhouette_samples_blocked(X, labels, rows=None, block_size=SILHOUETTE_BLOCK_SIZE):
+    """
+    Silhouette value of each selected row against all rows of X.
+
+    Distances are computed for `block_size` rows at a time and reduced to
+    per-cluster sums straight away, so memory is O(block_size * n).
+    """
+    X = np.asarray(X, dtype='float64')
+    _, codes = np.unique(labels, return_inverse=True)
+    n_clusters = codes.max() + 1
+    cluster_sizes = np.bincount(codes, minlength=n_clusters)
+    one_hot = np.zeros((len(X), n_clusters))
+    one_hot[np.arange(len(X)), codes] = 1.0
+
+    rows = np.arange(len(X)) if rows is None else np.asarray(rows)
+    values = np.empty(len(rows))
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        cluster_dist = euclidean_distances(X[block], X) @ one_hot
+        own = codes[block]
+        own_size = cluster_sizes[own]
+
+        # Mean distance to the own cluster excludes the point itself
+        a = cluster_dist[np.arange(len(block)), own] / np.maximum(own_size - 1, 1)
+        other = cluster_dist / cluster_sizes
+        other[np.arange(len(block)), own] = np.inf
+        b = other.min(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = (b - a) / np.maximum(a, b)
+        values[start:start + len(block)] = np.where(own_size > 1, np.nan_to_num(s), 0.0)
+    return values
+
+
+def silhouette_exact(X, labels, block_size=SILHOUETTE_BLOCK_SIZE):
+    """Exact mean silhouette score, computed in memory-bounded row blocks"""
+    return float(silhouette_samples_blocked(X, labels, block_size=block_size).mean())
+
+
+def silhouette_sampled(X, labels, sample_size=SILHOUETTE_SAMPLE_SIZE, confidence=0.95,
+                       random_state=RANDOM_STATE, block_size=SILHOUETTE_BLOCK_SIZE):
+    """
+    Estimate the mean silhouette from a cluster-stratified sample.
+
+    Sampled customers are scored against the other sampled customers, so the
+    cost is O(sample_size**2) whatever the customer count. The stratified
+    mean and its normal-approximation confidence interval are returned as a
+    dict with 'score', 'ci_low', 'ci_high' and 'sample_size'.
+    """
+    rng = np.random.default_rng(random_state)
+    _, codes = np.unique(labels, return_inverse=True)
+    weights = np.bincount(codes) / len(codes)
+
+    # Proportional allocation, with at least two customers per cluster
+    strata = []
+    for cluster, weight in enumerate(weights):
+        members = np.flatnonzero(codes == cluster)
+        size = min(len(members), max(2, int(round(weight * sample_size))))
+        strata.append(rng.choice(members, size=size, replace=False))
+
+    sample = np.concatenate(strata)
+    values = silhouette_samples_blocked(np.asarray(X)[sample], codes[sample], block_size=block_size)
+    score = 0.0
+    variance = 0.0
+    offset = 0
+    for weight, stratum in zip(weights, strata):
+        stratum_values = values[offset:offset + len(stratum)]
+        offset += len(stratum)
+        score += weight * stratum_values.mean()
+        if len(stratum_values) > 1:
+            # Finite population correction: a fully sampled cluster adds no error
+            fpc = 1 - len(stratum_values) / (weight * len(codes))
+            variance += weight ** 2 * stratum_values.var(ddof=1) / len(stratum_values) * fpc
+
+    margin = norm.ppf(0.5 + confidence / 2) * np.sqrt(variance)
+    return {'score': score, 'ci_low': score - margin, 'ci_high': score + margin, 'sample_size': len(values)}
+
+
+def scalable_silhouette(X, labels, exact_limit=SILHOUETTE_EXACT_LIMIT, sample_size=SILHOUETTE_SAMPLE_SIZE,
+                        random_state=RANDOM_STATE):
+    """Mean silhouette: exact up to `exact_limit` customers, stratified sample above"""
+    if len(X) <= exact_limit:
+        return silhouette_exact(X, labels)
+    return silhouette_sampled(X, labels, sample_size=sample_size, random_state=random_state)['score']
+
+
+def _limit_worker_threads():
+    """Pool initializer: one BLAS/OpenMP thread per worker; the pool provides the parallelism"""
+    threadpool_limits(limits=1)
+
+
+def evaluate_k(X, k, seed=RANDOM_STATE, n_init=N_INIT):
+    """Fit K-Means for one (K, seed) pair and return its inertia and silhouette"""
+    start = time.perf_counter()
+    kmeans = KMeans(n_clusters=k, random_state=seed, n_init=n_init).fit(X)
+    seconds = time.perf_counter() - start
+    score = scalable_silhouette(X, kmeans.labels_)
+    return {'K': k, 'Seed': seed, 'Inertia': kmeans.inertia_, 'Silhouette': score, 'Seconds': seconds}
+
+
+def _evaluate_run(run, X, n_init):
+    k, seed = run
+    return evaluate_k(X, k, seed=seed, n_init=n_init)
+
+
+def run_k_sweep(X, k_range=K_RANGE, seeds=(RANDOM_STATE,), n_init=N_INIT, max_workers=None, path=K_SWEEP_PATH):
+    """
+    Fit every (K, seed) combination in a process pool.
+
+    Returns one row per run with its inertia, silhouette score and fit time
+    and, when `path` is set, saves them as a CSV artifact. Pool workers use
+    one BLAS/OpenMP thread each. With max_workers=1 the runs are fitted in
+    this process, without a pool, and keep the default thread settings. On
+    platforms that spawn workers, call this from a __main__ guard.
+    """
+    runs = [(k, seed) for k in k_range for seed in seeds]
+    evaluate = partial(_evaluate_run, X=X, n_init=n_init)
+    if max_workers == 1:
+        results = list(map(evaluate, runs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_limit_worker_threads) as pool:
+            results = list(pool.map(evaluate, runs))
+
+    metrics = pd.DataFrame(results)
+    if path:
+        _save_k_sweep(metrics, path)
+    return metrics
+
+
+def _save_k_sweep(metrics, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    metrics.to_csv(path, index=False)
+
+
+def split_worst_cluster(X, centers, random_state=RANDOM_STATE):
+    """Replace the highest-inertia cluster's centroid with a 2-means split of it"""
+    distances = euclidean_distances(X, centers, squared=True)
+    labels = distances.argmin(axis=1)
+    cluster_sse = np.bincount(labels, weights=distances.min(axis=1), minlength=len(centers))
+
+    for worst in np.argsort(cluster_sse)[::-1]:
+        members = X[labels == worst]
+        if len(members) >= 2:
+            halves = KMeans(n_clusters=2, random_state=random_state, n_init=3).fit(members)
+            return np.vstack([np.delete(centers, worst, axis=0), halves.cluster_centers_])
+    raise ValueError("No cluster has enough points to split")
+
+
+def run_warm_k_sweep(X, k_range=K_RANGE, n_init=N_INIT, random_state=RANDOM_STATE, path=K_SWEEP_PATH):
+    """
+    Sweep K with each solution warm-started from the previous one.
+
+    The smallest K gets a regular multi-init K-Means; every larger K starts
+    from the previous centroids with the highest-inertia cluster split in
+    two, and runs a single init. Returns the same metrics as run_k_sweep.
+    """
+    X = np.asarray(X, dtype='float64')
+    results = []
+    centers = None
+    for k in sorted(k_range):
+        start = time.perf_counter()
+        if centers is None:
+            kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=n_init).fit(X)
+        else:
+            while len(centers) < k:
+                centers = split_worst_cluster(X, centers, random_state)
+            kmeans = KMeans(n_clusters=k, init=centers, n_init=1, random_state=random_state).fit(X)
+        seconds = time.perf_counter() - start
+
+        centers = kmeans.cluster_centers_
+        score = scalable_silhouette(X, kmeans.labels_)
+        results.append({'K': k, 'Seed': random_state, 'Inertia': kmeans.inertia_, 'Silhouette': score,
+                        'Seconds': seconds})
+
+    metrics = pd.DataFrame(results)
+    if path:
+        _save_k_sweep(metrics, path)
+    return metrics
+
+
+def benchmark_k_sweeps(X, k_range=K_RANGE, threads=None):
+    """
+    Fit time, total inertia and best K of the cold per-K loop vs the warm-started sweep.
+
+    The cold side is the notebook's original loop,
+    KMeans(n_clusters=k, random_state=42, n_init=10) for every K. Both sweeps
+    run in this process under the same BLAS/OpenMP thread limit (`threads`,
+    default: the current settings), so their fit times are comparable.
+    """
+    with threadpool_limits(limits=threads):
+        cold = pd.DataFrame([evaluate_k(X, k, seed=RANDOM_STATE, n_init=N_INIT) for k in k_range])
+        warm = run_warm_k_sweep(X, k_range, path=None)
+    return pd.DataFrame({
+        'Fit Seconds': [cold['Seconds'].sum(), warm['Seconds'].sum()],
+        'Total Inertia': [cold['Inertia'].sum(), warm['Inertia'].sum()],
+        'Best K': [best_k(cold), best_k(warm)],
+    }, index=pd.Index(['cold', 'warm'], name='Sweep'))
+
+
+def summarize_k_sweep(metrics):
+    """Mean inertia and silhouette per K across seeds"""
+    return metrics.groupby('K')[['Inertia', 'Silhouette']].mean()
+
+
+def best_k(metrics):
+    """K with the highest mean silhouette score"""
+    return int(summarize_k_sweep(metrics)['Silhouette'].idxmax())
+
+
+def kmeans_inits(X, n_clusters, n_init=N_INIT, seed=RANDOM_STATE):
+    """
+    The k-means++ starting centroids KMeans(random_state=seed, n_init=n_init) would use.
+
+    Inits are drawn in order from one RandomState on mean-centred data, as
+    in KMeans.fit, so fitting each from its init with n_init=1 reproduces the
+    individual runs of the sequential n_init loop.
+    """
+    X_mean = X.mean(axis=0)
+    X_centered = X - X_mean
+    x_squared_norms = row_norms(X_centered, squared=True)
+    rng = np.random.RandomState(seed)
+    return [
+        kmeans_plusplus(X_centered, n_clusters, x_squared_norms=x_squared_norms, random_state=rng)[0] + X_mean
+        for _ in range(n_init)
+    ]
+
+
+def _fit_init(run, X, n_clusters):
+    """Fit K-Means from one (seed, init, centroids) start"""
+    seed, init, centers = run
+    start = time.perf_counter()
+    model = KMeans(n_clusters=n_clusters, init=centers, n_init=1, random_state=seed).fit(X)
+    seconds = time.perf_counter() - start
+    return {'Seed': seed, 'Init': init, 'Inertia': model.inertia_, 'Iterations': model.n_iter_,
+            'Seconds': seconds}, model
+
+
+def _same_clustering(labels, other):
+    """True when two label arrays are the same partition up to renumbering"""
+    pairs = np.unique(np.asarray(labels, dtype='int64') * (other.max() + 1) + other)
+    return len(pairs) == len(np.unique(labels)) == len(np.unique(other))
+
+
+def train_kmeans_parallel(X, n_clusters, seeds=(RANDOM_STATE,), n_init=N_INIT, max_workers=None,
+                          path=KMEANS_RUNS_PATH):
+    """
+    Train K-Means with every init of every seed in a process pool.
+
+    Runs are visited in (seed, init) order and a run replaces the best one
+    only if its inertia is lower and its clustering differs, as in
+    scikit-learn, so the result is deterministic and with a single seed equals
+    KMeans(random_state=seed, n_init=n_init).fit(X). Returns the best model
+    and one row per run with its inertia, iterations, fit time, adjusted Rand
+    index against the chosen model and whether it was chosen. Pool workers
+    use one BLAS/OpenMP thread each. With max_workers=1 the runs are fitted
+    in this process, without a pool, and keep the default thread settings.
+    """
+    X = np.asarray(X, dtype='float64')
+    runs = [(seed, i, centers) for seed in seeds
+            for i, centers in enumerate(kmeans_inits(X, n_clusters, n_init, seed))]
+    fit = partial(_fit_init, X=X, n_clusters=n_clusters)
+    if max_workers == 1:
+        fitted = list(map(fit, runs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_limit_worker_threads) as pool:
+            fitted = list(pool.map(fit, runs))
+
+    best = None
+    for i, (row, model) in enumerate(fitted):
+        if best is None or (row['Inertia'] < fitted[best][0]['Inertia']
+                            and not _same_clustering(model.labels_, fitted[best][1].labels_)):
+            best = i
+    best_model = fitted[best][1]
+
+    metrics = pd.DataFrame([row for row, _ in fitted])
+    metrics['ARI'] = [adjusted_rand_score(best_model.labels_, model.labels_) for _, model in fitted]
+    metrics['Best'] = np.arange(len(fitted)) == best
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        metrics.to_csv(path, index=False)
+    return best_model, metrics
+
+
+def summarize_kmeans_runs(metrics):
+    """Per seed: inertia of its best run, that run's ARI against the chosen model, total fit time"""
+    best_runs = metrics.loc[metrics.groupby('Seed')['Inertia'].idxmin()].set_index('Seed')
+    return best_runs[['Inertia', 'ARI']].assign(Seconds=metrics.groupby('Seed')['Seconds'].sum())
+
+
+# Arrays shared with the bootstrap workers, attached once per process
+_SHARED = {}
+
+
+def _share_array(array):
+    """Copy an array into a new shared memory block; returns the block and its descriptor"""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _attach_shared(arrays):
+    """Pool initializer: map the shared arrays into this worker and limit its threads"""
+    _limit_worker_threads()
+    for key, (name, shape, dtype) in arrays.items():
+        block = shared_memory.SharedMemory(name=name)
+        _SHARED[key] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+
+def fit_bootstrap_kmeans(X, n_clusters, seed, n_init=BOOTSTRAP_N_INIT, minibatch_limit=BOOTSTRAP_MINIBATCH_LIMIT):
+    """
+    Fit the segmentation on one resample with the fast training paths.
+
+    Up to `minibatch_limit` rows this is a K-Means with a few inits;
+    above it, MiniBatch K-Means initialised from a K-Means on a sample, as in
+    train_minibatch_kmeans.
+    """
+    if len(X) <= minibatch_limit:
+        return KMeans(n_clusters=n_clusters, n_init=n_init, random_state=seed).fit(X)
+
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(len(X), MINIBATCH_INIT_SAMPLE, replace=False)]
+    init = KMeans(n_clusters=n_clusters, n_init=n_init, random_state=seed).fit(sample)
+    return MiniBatchKMeans(
+        n_clusters=n_clusters, init=init.cluster_centers_, n_init=1, batch_size=MINIBATCH_SIZE,
+        max_iter=MINIBATCH_EPOCHS, reassignment_ratio=0, random_state=seed,
+    ).fit(X)
+
+
+def _bootstrap_run(run, n_clusters, n_init):
+    """
+    Refit on one bootstrap resample and compare it with the reference labels.
+
+    Every customer, in or out of the resample, is assigned with the refitted
+    model. A customer's co-assignment is the share of their reference
+    cluster that lands in the same bootstrap cluster as they do.
+    """
+    b, seed = run
+    X = _SHARED['X'][1]
+    reference = _SHARED['labels'][1]
+    start = time.perf_counter()
+    resample = np.random.default_rng(seed).integers(0, len(X), len(X))
+    model = fit_bootstrap_kmeans(X[resample], n_clusters, seed, n_init)
+    labels = model.predict(X)
+    seconds = time.perf_counter() - start
+
+    counts = np.zeros((reference.max() + 1, n_clusters))
+    np.add.at(counts, (reference, labels), 1)
+    coassignment = (counts / counts.sum(axis=1, keepdims=True))[reference, labels]
+    row = {'Bootstrap': b, 'Seed': seed, 'ARI': adjusted_rand_score(reference, labels),
+           'Inertia': model.inertia_, 'Seconds': seconds}
+    return row, coassignment.astype('float32')
+
+
+def bootstrap_stability(X, labels, n_bootstraps=BOOTSTRAP_SAMPLES, n_init=BOOTSTRAP_N_INIT,
+                        random_state=RANDOM_STATE, max_workers=None, path=BOOTSTRAP_PATH):
+    """
+    Bootstrap cluster-stability evaluation of a segmentation.
+
+    Retrains K-Means (with as many clusters as `labels`) on `n_bootstraps`
+    resamples of X in a process pool. X and the reference labels are placed
+    in shared memory once, so workers never receive copies. Returns the
+    per-customer stability (mean co-assignment with their reference cluster
+    across bootstraps, 1 = always kept together) and one row per bootstrap
+    with its adjusted Rand index against the reference labels. Pool workers
+    use one BLAS/OpenMP thread each. With max_workers=1 the bootstraps run
+    in this process, without a pool or shared memory, and keep the default
+    thread settings. On platforms that spawn workers, call this from a
+    __main__ guard.
+    """
+    X = np.ascontiguousarray(X, dtype='float64')
+    labels = np.asarray(labels, dtype='int64')
+    n_clusters = int(labels.max()) + 1
+    seeds = np.random.default_rng(random_state).integers(np.iinfo('int32').max, size=n_bootstraps)
+
+    stability = np.zeros(len(X))
+    results = []
+
+    def collect(outputs):
+        nonlocal stability
+        for row, coassignment in outputs:
+            results.append(row)
+            stability += coassignment
+
+    bootstrap = partial(_bootstrap_run, n_clusters=n_clusters, n_init=n_init)
+    runs = enumerate(seeds.tolist())
+    if max_workers == 1:
+        _SHARED.update({'X': (None, X), 'labels': (None, labels)})
+        try:
+            collect(map(bootstrap, runs))
+        finally:
+            _SHARED.clear()
+    else:
+        blocks = {}
+        try:
+            shared = {}
+            for key, array in (('X', X), ('labels', labels)):
+                blocks[key], shared[key] = _share_array(array)
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_shared,
+                                     initargs=(shared,)) as pool:
+                collect(pool.map(bootstrap, runs))
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+    metrics = pd.DataFrame(results)
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        metrics.to_csv(path, index=False)
+    return stability / n_bootstraps, metrics
+
+
+def summarize_bootstrap_ari(metrics):
+    """Mean, spread and 5th/50th/95th percentiles of the bootstrap ARI distribution"""
+    ari = metrics['ARI']
+    return pd.Series({
+        'Mean': ari.mean(), 'Std': ari.std(),
+        'P05': ari.quantile(0.05), 'Median': ari.median(), 'P95': ari.quantile(0.95),
+    }, name='ARI')
+
+
+def iter_rfm_batches(path, batch_size=MINIBATCH_SIZE):
+    """Stream the RFM features of a persisted RFM table as float arrays"""
+    dtypes = {feature: RFM_DTYPES[feature] for feature in RFM_FEATURES}
+    for chunk in pd.read_csv(path, usecols=RFM_FEATURES, dtype=dtypes, chunksize=batch_size):
+        yield chunk[RFM_FEATURES].to_numpy(dtype='float64')
+
+
+def train_minibatch_kmeans(path, n_clusters, batch_size=MINIBATCH_SIZE, n_epochs=MINIBATCH_EPOCHS,
+                           init_sample_size=MINIBATCH_INIT_SAMPLE, random_state=RANDOM_STATE):
+    """
+    Fit the scaler and a MiniBatch K-Means model from a streamed RFM table.
+
+    The first pass fits the StandardScaler incrementally and keeps a uniform
+    random sample of customers (bottom-k on random keys). Centroids are
+    initialised by a full K-Means on that sample, then each epoch feeds the
+    scaled batches to MiniBatchKMeans.partial_fit. Only one batch plus the
+    sample is in memory at a time. Returns the fitted scaler and model.
+    """
+    rng = np.random.default_rng(random_state)
+    scaler = StandardScaler()
+    sample = np.empty((0, len(RFM_FEATURES)))
+    sample_keys = np.empty(0)
+    for batch in iter_rfm_batches(path, batch_size):
+        scaler.partial_fit(batch)
+        sample = np.concatenate([sample, batch])
+        sample_keys = np.concatenate([sample_keys, rng.random(len(batch))])
+        keep = np.argsort(sample_keys)[:init_sample_size]
+        sample, sample_keys = sample[keep], sample_keys[keep]
+
+    init = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=N_INIT)
+    init.fit(scaler.transform(sample))
+
+    # No random reassignment: small clusters (e.g. top spenders) are real segments
+    model = MiniBatchKMeans(
+        n_clusters=n_clusters, init=init.cluster_centers_, n_init=1,
+        batch_size=batch_size, reassignment_ratio=0, random_state=random_state,
+    )
+    for _ in range(n_epochs):
+        for batch in iter_rfm_batches(path, batch_size):
+            model.partial_fit(scaler.transform(batch))
+    return scaler, model
+
+
+def label_clusters(batches, scaler, model):
+    """
+    Segment name per cluster of a trained model, as in notebook Step 8.
+
+    Streams batches of raw RFM values once, assigning customers to clusters
+    and building the RFM quantile sketches; the per-cluster means are then
+    labelled with the segment rules. Returns the {cluster: segment} mapping
+    and the cluster summary (Avg_Recency, Avg_Frequency, Avg_Monetary,
+    Customer_Count).
+    """
+    n_clusters = len(model.cluster_centers_)
+    sums = np.zeros((n_clusters, len(RFM_FEATURES)))
+    counts = np.zeros(n_clusters)
+    sketches = None
+    for batch in batches:
+        sketches = build_rfm_sketches(pd.DataFrame(batch, columns=RFM_FEATURES), sketches)
+        labels = model.predict(scaler.transform(batch))
+        np.add.at(sums, labels, batch)
+        counts += np.bincount(labels, minlength=n_clusters)
+
+    means = np.divide(sums, counts[:, None], out=np.full_like(sums, np.nan), where=counts[:, None] > 0)
+    summary = pd.DataFrame(means, columns=[f"Avg_{feature}" for feature in RFM_FEATURES])
+    summary['Customer_Count'] = counts.astype('int64')
+    segments = label_segments(summary, compile_segment_rules(rfm_thresholds(sketches)), prefix='Avg_')
+    return segments.to_dict(), summary.rename_axis('Cluster')
+
+
+def _replace_artifacts(writers):
+    """
+    Write a set of artifacts so they are replaced together.
+
+    `writers` maps each destination path to a function writing it. Every
+    artifact is first written to a temporary file, and the files are only
+    moved into place once all of them were written, so a failed export never
+    leaves a new model next to labels or arrays of the old one.
+    """
+    staged = {}
+    try:
+        for path, write in writers.items():
+            root, ext = os.path.splitext(path)
+            staged[path] = f"{root}.tmp{ext}"
+            write(staged[path])
+        for path, tmp_path in staged.items():
+            os.replace(tmp_path, path)
+    finally:
+        for tmp_path in staged.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def save_segmentation_model(scaler, model, cluster_labels, output_dir=MODELS_DIR):
+    """Write scaler.pkl, kmeans_model.pkl, cluster_labels.pkl and segment_model.npz together"""
+    predictor = SegmentPredictor.from_models(scaler, model, cluster_labels)
+    os.makedirs(output_dir, exist_ok=True)
+    _replace_artifacts({
+        os.path.join(output_dir, 'scaler.pkl'): partial(joblib.dump, scaler),
+        os.path.join(output_dir, 'kmeans_model.pkl'): partial(joblib.dump, model),
+        os.path.join(output_dir, 'cluster_labels.pkl'): partial(joblib.dump, cluster_labels),
+        os.path.join(output_dir, SEGMENT_MODEL_FILE): predictor.save,
+    })
+
+
+class OnlineSegmenter:
+    """
+    Online K-Means on top of a trained scaler and segmentation model.
+
+    Each batch of updated customer RFM vectors is scaled, assigned to the
+    nearest centroid, and every centroid moves towards the mean of its
+    assigned customers with rate m / n, where m is the number of customers
+    assigned in the batch and n the centroid's running count. Counts start
+    from the training cluster sizes and are multiplied by `decay` before
+    each batch, so the learning rate decays with the data seen but never
+    freezes. Training sizes come from the model's `cluster_sizes_`, saved
+    by the training commands, since a MiniBatch model's `labels_` only
+    cover its last batch; older models fall back to `labels_`. Cluster ids
+    are stable, so the model's own `cluster_labels` still apply and are
+    exported with every checkpoint.
+    """
+
+    def __init__(self, scaler, model, cluster_labels, decay=ONLINE_DECAY, checkpoint_path=None,
+                 checkpoint_every=ONLINE_CHECKPOINT_EVERY):
+        self.scaler = scaler
+        self.model = model
+        self.cluster_labels = cluster_labels
+        self.centers = np.array(model.cluster_centers_, dtype='float64')
+        labels = getattr(model, 'labels_', None)
+        n_clusters = len(self.centers)
+        if getattr(model, 'cluster_sizes_', None) is not None:
+            self.counts = np.asarray(model.cluster_sizes_, dtype='float64').copy()
+        elif labels is not None and len(labels):
+            self.counts = np.bincount(labels, minlength=n_clusters).astype('float64')
+        else:
+            self.counts = np.ones(n_clusters)
+        self.decay = decay
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self._since_checkpoint = 0
+
+    def partial_update(self, rfm_values):
+        """Assign a batch of raw RFM vectors, update the centroids and return the labels"""
+        X = self.scaler.transform(np.asarray(rfm_values, dtype='float64'))
+        labels = euclidean_distances(X, self.centers, squared=True).argmin(axis=1)
+
+        n_clusters = len(self.centers)
+        assigned = np.bincount(labels, minlength=n_clusters).astype('float64')
+        sums = np.zeros_like(self.centers)
+        np.add.at(sums, labels, X)
+
+        self.counts = self.counts * self.decay + assigned
+        touched = assigned > 0
+        rate = assigned[touched] / self.counts[touched]
+        batch_means = sums[touched] / assigned[touched, None]
+        self.centers[touched] += rate[:, None] * (batch_means - self.centers[touched])
+
+        self._since_checkpoint += len(X)
+        if self.checkpoint_path and self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+        return labels
+
+    def to_model(self):
+        """Copy of the segmentation model carrying the current centroids and counts"""
+        model = copy.deepcopy(self.model)
+        model.cluster_centers_ = self.centers.copy()
+        model.cluster_sizes_ = self.counts.copy()
+        return model
+
+    def checkpoint(self, path=None):
+        """Write the current model and its segment_model.npz together, where load_models() reads them"""
+        path = path or self.checkpoint_path
+        model = self.to_model()
+        predictor = SegmentPredictor.from_models(self.scaler, model, self.cluster_labels)
+        _replace_artifacts({
+            path: partial(joblib.dump, model),
+            os.path.join(os.path.dirname(path) or '.', SEGMENT_MODEL_FILE): predictor.save,
+        })
+        self._since_checkpoint = 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the Shopper Spectrum segmentation model")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    minibatch = commands.add_parser('minibatch', help="stream an RFM table through MiniBatch K-Means")
+    minibatch.add_argument('--rfm', default=os.path.join(MODELS_DIR, 'rfm_data.csv'), help="RFM table (CSV)")
+    minibatch.add_argument('--clusters', type=int, required=True, help="number of segments")
+    minibatch.add_argument('--batch-size', type=int, default=MINIBATCH_SIZE)
+    minibatch.add_argument('--epochs', type=int, default=MINIBATCH_EPOCHS)
+    minibatch.add_argument('--output-dir', default=APP_MODELS_DIR,
+                           help="directory of the deployed model (default: where the apps load it from)")
+
+    train = commands.add_parser('train', help="train K-Means with inits and seeds spread across processes")
+    train.add_argument('--rfm', default=os.path.join(MODELS_DIR, 'rfm_data.csv'), help="RFM table (CSV)")
+    train.add_argument('--clusters', type=int, required=True, help="number of segments")
+    train.add_argument('--seeds', type=int, nargs='+', default=list(TRAINING_SEEDS))
+    train.add_argument('--n-init', type=int, default=N_INIT)
+    train.add_argument('--workers', type=int, default=None)
+    train.add_argument('--output-dir', default=APP_MODELS_DIR,
+                       help="directory of the deployed model (default: where the apps load it from)")
+
+    benchmark = commands.add_parser('benchmark-sweep', help="time the cold vs warm-started K sweep")
+    benchmark.add_argument('--rfm', default=os.path.join(MODELS_DIR, 'rfm_data.csv'), help="RFM table (CSV)")
+    benchmark.add_argument('--threads', type=int, default=None,
+                           help="BLAS/OpenMP threads for both sweeps (default: unchanged)")
+
+    online = commands.add_parser('online', help="stream updated RFM vectors through online centroid updates")
+    online.add_argument('--rfm', required=True, help="updated customer RFM vectors (CSV)")
+    online.add_argument('--batch-size', type=int, default=MINIBATCH_SIZE)
+    online.add_argument('--decay', type=float, default=ONLINE_DECAY)
+    online.add_argument('--checkpoint-every', type=int, default=ONLINE_CHECKPOINT_EVERY)
+    online.add_argument('--models-dir', default=APP_MODELS_DIR,
+                        help="directory of the deployed model (default: where the apps load it from)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'minibatch':
+        scaler, model = train_minibatch_kmeans(args.rfm, args.clusters, args.batch_size, args.epochs)
+        cluster_labels, summary = label_clusters(iter_rfm_batches(args.rfm, args.batch_size), scaler, model)
+        model.cluster_sizes_ = summary['Customer_Count'].to_numpy()
+        save_segmentation_model(scaler, model, cluster_labels, args.output_dir)
+        print(summary.assign(Segment=pd.Series(cluster_labels)).round(2))
+        print(f"✅ MiniBatch K-Means ({args.clusters} clusters) saved to {args.output_dir}/")
+    elif args.command == 'train':
+        rfm_values = np.concatenate(list(iter_rfm_batches(args.rfm)))
+        scaler = StandardScaler().fit(rfm_values)
+        X = scaler.transform(rfm_values)
+        model, runs = train_kmeans_parallel(X, args.clusters, args.seeds, args.n_init, args.workers)
+        cluster_labels, summary = label_clusters([rfm_values], scaler, model)
+        model.cluster_sizes_ = summary['Customer_Count'].to_numpy()
+        save_segmentation_model(scaler, model, cluster_labels, args.output_dir)
+        print(summarize_kmeans_runs(runs))
+        print(summary.assign(Segment=pd.Series(cluster_labels)).round(2))
+        print(f"✅ K-Means ({args.clusters} clusters, best of {len(runs)} runs) saved to {args.output_dir}/")
+    elif args.command == 'benchmark-sweep':
+        X = StandardScaler().fit_transform(np.concatenate(list(iter_rfm_batches(args.rfm))))
+        report = benchmark_k_sweeps(X, threads=args.threads)
+        print(report)
+        saved = 1 - report.loc['warm', 'Fit Seconds'] / report.loc['cold', 'Fit Seconds']
+        print(f"⏱️ Warm-started sweep saves {saved:.0%} of K-Means fit time")
+    elif args.command == 'online':
+        model_path = os.path.join(args.models_dir, 'kmeans_model.pkl')
+        segmenter = OnlineSegmenter(
+            joblib.load(os.path.join(args.models_dir, 'scaler.pkl')), joblib.load(model_path),
+            joblib.load(os.path.join(args.models_dir, 'cluster_labels.pkl')),
+            decay=args.decay, checkpoint_path=model_path, checkpoint_every=args.checkpoint_every,
+        )
+        processed = 0
+        for batch in iter_rfm_batches(args.rfm, args.batch_size):
+            segmenter.partial_update(batch)
+            processed += len(batch)
+        segmenter.checkpoint()
+        print(f"✅ Centroids updated from {processed:,} customers and saved to {model_path}")
+
+
+if __name__ == '__main__':
+    main()